@@ -0,0 +1,117 @@
+"""Import time of a cold Sigma worker, summarised from ``python -X importtime``.
+
+Every Streamlit worker (and every supervisor restart) pays for the imports of
+``sigma_app.py`` before it can serve a page. This starts fresh interpreters
+that import what the app imports, parses the ``-X importtime`` report and
+prints the total, the packages that cost the most and the slowest modules.
+
+It also checks that the modules in ``--forbid`` (by default the history
+layer's LangChain and PostgreSQL packages, and the libraries that are only
+needed once a request arrives) are not loaded at start-up, and with
+``--budget-ms`` exits non-zero when the median total exceeds the budget.
+``tests/test_import_budget.py`` runs the same checks under pytest:
+
+    python bench/bench_imports.py [--repeat 5] [--top 15] [--budget-ms 1500] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What sigma_app.py imports before rendering a page.
+DEFAULT_MODULES = ['streamlit', 'dotenv', 'engagebot.interactions', 'engagebot.page']
+# Loaded on first use only: persisted messages, the first model request, token counting, exports.
+DEFAULT_FORBID = ['langchain_core', 'langchain_community', 'psycopg', 'psycopg_pool', 'ollama', 'tiktoken', 'pyarrow']
+
+
+def parse_importtime(text: str) -> list:
+    """(module, self_us, cumulative_us, depth) for every line of an ``-X importtime`` report."""
+    entries = []
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def measure(modules) -> list:
+    """Import ``modules`` in a fresh interpreter and return its parsed report."""
+    statement = f'import sys; sys.path.insert(0, {ROOT!r}); ' + '; '.join(f'import {name}' for name in modules)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement], cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"importing {', '.join(modules)} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def loaded_packages(entries) -> set:
+    return {name.split('.')[0] for name, _, _, _ in entries}
+
+
+def summarise(entries, top: int) -> dict:
+    packages = {}
+    for name, self_us, _, _ in entries:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return {
+        'total_ms': sum(cumulative for _, _, cumulative, depth in entries if depth == 0) / 1000,
+        'modules_loaded': len(entries),
+        'packages_ms': {name: us / 1000 for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]},
+        'slowest_ms': {name: us / 1000 for name, us, _, _ in sorted(entries, key=lambda entry: -entry[1])[:top]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', action='append', dest='modules', help="module to import (repeatable)")
+    parser.add_argument('--forbid', action='append', help="package that must not be imported (repeatable)")
+    parser.add_argument('--repeat', type=int, default=5, help="cold starts measured; the median is reported")
+    parser.add_argument('--top', type=int, default=15, help="packages and modules listed")
+    parser.add_argument('--budget-ms', type=float, help="exit non-zero if the median total exceeds this")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    modules = args.modules or DEFAULT_MODULES
+    forbid = args.forbid if args.forbid is not None else DEFAULT_FORBID
+
+    # The first run also warms the bytecode cache, so it is not counted.
+    runs = [measure(modules) for _ in range(args.repeat + 1)][1:]
+    totals = [summarise(entries, args.top)['total_ms'] for entries in runs]
+    median = statistics.median(totals)
+    # Report the run closest to the median.
+    report = summarise(runs[min(range(len(runs)), key=lambda i: abs(totals[i] - median))], args.top)
+    report['total_ms'] = median
+    report['runs_ms'] = totals
+    report['forbidden_loaded'] = sorted(loaded_packages(runs[0]).intersection(forbid))
+    report['budget_ms'] = args.budget_ms
+    failed = bool(report['forbidden_loaded']) or (args.budget_ms is not None and median > args.budget_ms)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 1 if failed else 0
+    print(f"import {', '.join(modules)}")
+    print(f"cold start: {median:.0f} ms median of {len(totals)} "
+          f"(min {min(totals):.0f}, max {max(totals):.0f}), {report['modules_loaded']} modules")
+    print("\nby package (self time):")
+    for name, ms in report['packages_ms'].items():
+        print(f"  {ms:8.1f} ms  {name}")
+    print("\nslowest modules (self time):")
+    for name, ms in report['slowest_ms'].items():
+        print(f"  {ms:8.1f} ms  {name}")
+    if report['forbidden_loaded']:
+        print(f"\nFAIL: loaded at start-up: {', '.join(report['forbidden_loaded'])}")
+    if args.budget_ms is not None:
+        verdict = 'FAIL' if median > args.budget_ms else 'ok'
+        print(f"\n{verdict}: {median:.0f} ms against a budget of {args.budget_ms:.0f} ms")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Memory of one process per interaction versus one process for all of them.
+
+Each interaction script used to run in its own Streamlit process, and each
+process imported Streamlit, LangChain (with ``langchain_community``'s
+Postgres history) and the Ollama client for itself. This starts a fresh
+interpreter for each of two configurations and reports its peak RSS:
+
+- fleet: what one old interaction script imported, as ``init-sigma.sh`` used
+  to start one per interaction (as many as ``--interactions``, default:
+  every defined interaction),
+- single: one ``sigma_app.py`` worker holding every definition, with the
+  history layer and the Ollama client it loads on first use.
+
+Sessions and cached conversations cost the same either way and are left out.
+
+    python bench/bench_memory.py [--interactions 8] [--json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in the child interpreter after the imports; prints its peak RSS in KiB.
+_RSS = """
+import resource
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+# The imports of one old per-interaction script (e.g. nsc396a_interaction2.py).
+BASELINE = """
+import streamlit.web.bootstrap
+import ollama
+from ollama import Client
+import streamlit as st
+from langchain_community.chat_message_histories import PostgresChatMessageHistory
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from langchain_core.messages.ai import AIMessage
+from langchain_core.messages.human import HumanMessage
+from dotenv import load_dotenv
+""" + _RSS
+
+# One sigma_app.py worker once it has served a persisted page.
+SINGLE = """
+import sys
+sys.path.insert(0, {root!r})
+import streamlit.web.bootstrap
+import streamlit as st
+from dotenv import load_dotenv
+import engagebot.page
+import engagebot.history
+from ollama import AsyncClient
+from engagebot.interactions import get_registry
+get_registry().all()
+""" + _RSS
+
+
+def rss_mb(program: str) -> float:
+    output = subprocess.run(
+        [sys.executable, '-c', program], check=True, capture_output=True, text=True, cwd=ROOT,
+    ).stdout
+    # ru_maxrss is in KiB on Linux.
+    return int(output.split()[-1]) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--interactions', type=int, help="processes in the per-interaction fleet")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from engagebot.interactions import get_registry
+
+    interactions = args.interactions or len(get_registry().all())
+    per_script = rss_mb(BASELINE)
+    single = rss_mb(SINGLE.format(root=ROOT))
+    report = {
+        'interactions': interactions,
+        'script_rss_mb': per_script,
+        'fleet_rss_mb': per_script * interactions,
+        'single_rss_mb': single,
+        'saved_mb': per_script * interactions - single,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"one interaction script: {per_script:.0f} MB peak RSS")
+    print(f"fleet  ({interactions} processes): {report['fleet_rss_mb']:.0f} MB")
+    print(f"single (1 process):   {report['single_rss_mb']:.0f} MB, saving {report['saved_mb']:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""What a chat turn costs to draw, by the number of turns since the page loaded.
+
+Submitting a message reruns only the chat fragment of ``engagebot.page``, but
+a fragment rerun clears what it drew before, so it redraws every exchange
+sent since the last full run (opening or reloading the page) along with the
+new one. A turn's drawing work therefore grows with the turns since the page
+loaded, though not with the conversation the student resumed.
+
+This draws that many exchanges with ``engagebot.page.render_messages`` in
+Streamlit's ``AppTest`` (the real script runner, without a browser) and
+reports the median script time of one fragment rerun for each count:
+
+    python bench/bench_render.py [--turns 0 10 50 100 200] [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A short question and an answer of typical length.
+PROMPT = "Can you explain what the second question of the exercise is asking?"
+ANSWER = "The second question asks you to " + "compare the two approaches and say which one you would pick, and why. " * 8
+
+
+def fragment_rerun(root, turns, prompt, answer):
+    # The body of a fragment rerun: the exchanges since the last full run, then the new one.
+    import sys
+    sys.path.insert(0, root)
+    from engagebot.page import render_messages
+
+    messages = []
+    for _ in range(turns + 1):
+        messages.append({"role": "user", "content": prompt})
+        messages.append({"role": "assistant", "content": answer})
+    render_messages(messages)
+
+
+def measure(turns: int, repeat: int) -> float:
+    """Median seconds of a script run drawing ``turns`` earlier exchanges and a new one."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_function(fragment_rerun, args=(ROOT, turns, PROMPT, ANSWER), default_timeout=60)
+    app.run()  # Imports and warms the caches; not counted.
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        app.run()
+        times.append(time.perf_counter() - start)
+    if len(app.chat_message) != 2 * (turns + 1):
+        raise SystemExit(f"expected {2 * (turns + 1)} chat messages, drew {len(app.chat_message)}")
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[0, 10, 50, 100, 200],
+                        help="turns since the page loaded")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement; the median is reported")
+    args = parser.parse_args()
+
+    print(f"{'turns since load':>16}  {'messages drawn':>14}  {'script time':>11}")
+    for turns in args.turns:
+        seconds = measure(turns, args.repeat)
+        print(f"{turns:>16}  {2 * (turns + 1):>14}  {seconds * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Micro-benchmark: per-token placeholder writes vs. the coalescing renderer.
+
+Simulates an Ollama stream and a Streamlit placeholder that records every
+update it would send to the browser. Run from the repository root:
+
+    python bench/bench_streaming.py --tokens 800 --rate 40
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engagebot.streaming import CoalescingRenderer
+
+
+class RecordingContainer:
+    """Stand-in for st.empty() that counts deltas and bytes pushed."""
+
+    def __init__(self):
+        self.deltas = 0
+        self.bytes_sent = 0
+
+    def write(self, text):
+        self.deltas += 1
+        self.bytes_sent += len(text.encode("utf-8"))
+
+    def markdown(self, text, **kwargs):
+        self.write(text)
+
+    def empty(self):
+        self.deltas += 1
+
+
+class FakeClock:
+    """Clock advanced by the simulated stream, so results do not depend on sleeping."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fake_stream(tokens, rate, clock):
+    # Typical llama/mixtral tokens are a few characters long.
+    words = ["The ", "goal ", "is ", "to ", "reflect ", "on ", "your ", "midterm ", "prep", "aration", ". "]
+    for i in range(tokens):
+        clock.now += 1.0 / rate
+        yield {"message": {"content": words[i % len(words)]}}
+
+
+def legacy_loop(stream, container):
+    # The loop the interaction scripts used before the renderer.
+    first_chunk_received = False
+    full_message = ""
+    for chunk in stream:
+        if not first_chunk_received:
+            container.empty()
+            first_chunk_received = True
+        full_message += chunk["message"]["content"]
+        container.write(full_message)
+    return full_message
+
+
+def coalesced_loop(stream, container, clock):
+    renderer = CoalescingRenderer(container, clock=clock)
+    for chunk in stream:
+        renderer.write(chunk["message"]["content"])
+    renderer.flush()
+    return renderer.text
+
+
+def run(name, fn, tokens, rate, repeat):
+    deltas = bytes_sent = 0
+    start = time.process_time()
+    for _ in range(repeat):
+        clock = FakeClock()
+        container = RecordingContainer()
+        if fn is coalesced_loop:
+            fn(fake_stream(tokens, rate, clock), container, clock)
+        else:
+            fn(fake_stream(tokens, rate, clock), container)
+        deltas += container.deltas
+        bytes_sent += container.bytes_sent
+    cpu = (time.process_time() - start) / repeat
+    print(f"{name:<10} deltas/turn={deltas // repeat:>6}  bytes/turn={bytes_sent // repeat:>10}  cpu/turn={cpu * 1000:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=800, help="tokens per simulated response")
+    parser.add_argument("--rate", type=float, default=40.0, help="simulated tokens per second")
+    parser.add_argument("--repeat", type=int, default=50, help="responses per measurement")
+    args = parser.parse_args()
+
+    run("legacy", legacy_loop, args.tokens, args.rate, args.repeat)
+    run("coalesced", coalesced_loop, args.tokens, args.rate, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
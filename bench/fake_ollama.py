@@ -0,0 +1,136 @@
+"""Local stand-in for the Ollama HTTP API, for load tests without a GPU.
+
+Implements the endpoints the app uses:
+
+- POST /api/chat      streams NDJSON chunks at a fixed token rate after a
+                      configurable time to first token, ending with a final
+                      chunk that carries Ollama-style timing counters,
+- POST /api/generate  returns immediately (used by the warm-up command),
+- GET  /api/ps        lists the "loaded" model (used by health checks).
+
+Run standalone:
+
+    python bench/fake_ollama.py --port 11435 --ttft 0.3 --rate 40 --tokens 120
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("Let's ", "think ", "about ", "how ", "you ", "will ", "prepare ", "for ", "the ", "midterm", ". ")
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # Set by make_server().
+    ttft = 0.3
+    rate = 40.0
+    tokens = 120
+    jitter = 0.0
+    seed = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, payload: dict):
+        data = json.dumps(payload).encode('utf-8') + b'\n'
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == '/api/ps':
+            self._send_json({'models': [{'name': 'fake:latest', 'model': 'fake:latest'}]})
+        elif self.path == '/api/version':
+            self._send_json({'version': '0.0.0-fake'})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        request = self._read_json()
+        if self.path == '/api/generate':
+            self._send_json({'model': request.get('model'), 'response': '', 'done': True})
+        elif self.path == '/api/chat':
+            self._stream_chat(request)
+        else:
+            self.send_error(404)
+
+    def _stream_chat(self, request: dict):
+        model = request.get('model', 'fake')
+        prompt_tokens = sum(len(message.get('content', '')) // 4 + 1 for message in request.get('messages', []))
+        rng = random.Random(hash((self.seed, prompt_tokens)))
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        started = time.monotonic()
+        time.sleep(max(0.0, self.ttft * (1 + rng.uniform(-self.jitter, self.jitter))))
+        prefill = time.monotonic() - started
+
+        for i in range(self.tokens):
+            self._write_chunk({
+                'model': model,
+                'message': {'role': 'assistant', 'content': WORDS[i % len(WORDS)]},
+                'done': False,
+            })
+            time.sleep(1.0 / self.rate)
+        total = time.monotonic() - started
+
+        self._write_chunk({
+            'model': model,
+            'message': {'role': 'assistant', 'content': ''},
+            'done': True,
+            'done_reason': 'stop',
+            'total_duration': int(total * 1e9),
+            'load_duration': 0,
+            'prompt_eval_count': prompt_tokens,
+            'prompt_eval_duration': int(prefill * 1e9),
+            'eval_count': self.tokens,
+            'eval_duration': int((total - prefill) * 1e9),
+        })
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+
+def make_server(port=0, ttft=0.3, rate=40.0, tokens=120, jitter=0.0, seed=0) -> ThreadingHTTPServer:
+    """Build (but do not start) a fake server; port 0 picks a free port."""
+    handler = type('ConfiguredFakeOllamaHandler', (FakeOllamaHandler,), {
+        'ttft': ttft, 'rate': rate, 'tokens': tokens, 'jitter': jitter, 'seed': seed,
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama /api/chat server.")
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--ttft', type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument('--rate', type=float, default=40.0, help="tokens per second")
+    parser.add_argument('--tokens', type=int, default=120, help="tokens per response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="relative +/- jitter applied to the TTFT")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.ttft, args.rate, args.tokens, args.jitter, args.seed)
+    print(f"fake ollama listening on http://127.0.0.1:{server.server_address[1]}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
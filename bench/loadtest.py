@@ -0,0 +1,215 @@
+"""Load test: N simulated students chatting through the app's inference path.
+
+Starts bench/fake_ollama.py in a subprocess (so its CPU is not counted), points
+OLLAMA_HOSTS at it and drives N sessions, each sending a few turns through the
+same code the interaction scripts run per turn: ``fit_messages`` ->
+``chat_stream`` (gateway, admission control, router) -> ``render_stream``
+into a recording placeholder. Streamlit itself is not started.
+
+Reports p50/p95/p99 time to first token (as the student sees it, including
+queueing), end-to-end turn latency, rejected turns, and CPU time and peak RSS
+of this process. Runs are reproducible: arrival and think times come from
+``--seed`` and the fake server's timings are fixed.
+
+    python bench/loadtest.py --sessions 40 --turns 3 --ttft 0.3 --rate 40
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SYSTEM_MESSAGE = """Your name is Sigma and your only goal is to converse with me so I answer the following questions:
+1) What grade would you like to achieve in the midterm?
+2) How would you like to prepare for the midterm exam?
+3) When will you start doing each task that you just mentioned?
+
+Rules:
+- Never answer questions for me.
+- Keep the conversation on task.
+- Discuss one question at a time."""
+
+INITIAL_MESSAGE = """Hello! My name is Sigma and I am here to help you think through the following questions:
+1) What grade would you like to achieve in the midterm?
+2) How would you like to prepare for the midterm exam?
+3) When will you start doing each task that you just mentioned?
+
+Let's talk about them one at a time when you're ready."""
+
+STUDENT_MESSAGES = (
+    "hi, ready to start",
+    "I would like to get at least a B+ on the midterm.",
+    "I plan to redo the weekly quizzes and make flash cards for the key terms.",
+    "I'll start this weekend and do a bit every evening.",
+)
+
+
+class TimingContainer:
+    """Stand-in for st.empty() that notes when the first response text is shown."""
+
+    def __init__(self):
+        self.first_text_at = None
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        if self.first_text_at is None and text:
+            self.first_text_at = time.perf_counter()
+
+    def markdown(self, text, **kwargs):
+        pass
+
+    def empty(self):
+        pass
+
+    def warning(self, text):
+        pass
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_server(args):
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, 'bench', 'fake_ollama.py'),
+        '--port', str(port), '--ttft', str(args.ttft), '--rate', str(args.rate),
+        '--tokens', str(args.tokens), '--jitter', str(args.jitter), '--seed', str(args.seed),
+    ], stdout=subprocess.PIPE, text=True)
+    # The server prints one line once it is listening.
+    process.stdout.readline()
+    return process, f'http://127.0.0.1:{port}'
+
+
+def simulate_session(index, args, results, lock):
+    from engagebot.context import fit_messages
+    from engagebot.gateway import GatewayBusy, chat_stream
+    from engagebot.streaming import render_stream
+
+    rng = random.Random(args.seed * 1000 + index)
+    time.sleep(rng.uniform(0, args.ramp))
+
+    messages = [
+        {'role': 'system', 'content': SYSTEM_MESSAGE},
+        {'role': 'assistant', 'content': INITIAL_MESSAGE},
+    ]
+    for turn in range(args.turns):
+        messages.append({'role': 'user', 'content': STUDENT_MESSAGES[turn % len(STUDENT_MESSAGES)]})
+        container = TimingContainer()
+        started = time.perf_counter()
+        try:
+            stream = chat_stream(
+                model=args.model,
+                messages=fit_messages(messages),
+                session_id=f'loadtest-{index}',
+                tags={'course': 'loadtest', 'week': '0', 'interaction': '0'},
+            )
+            response = render_stream(stream, container)
+        except GatewayBusy:
+            with lock:
+                results['rejected'] += 1
+            messages.pop()
+            continue
+        finished = time.perf_counter()
+        messages.append({'role': 'assistant', 'content': response})
+
+        with lock:
+            if container.first_text_at is not None:
+                results['ttft'].append(container.first_text_at - started)
+            results['latency'].append(finished - started)
+            results['deltas'].append(container.writes)
+        time.sleep(rng.uniform(*args.think))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=40, help="simulated students")
+    parser.add_argument('--turns', type=int, default=3, help="turns per student")
+    parser.add_argument('--ramp', type=float, default=30.0, help="seconds over which students arrive")
+    parser.add_argument('--think', type=float, nargs=2, default=(2.0, 8.0), metavar=('MIN', 'MAX'),
+                        help="seconds a student spends typing between turns")
+    parser.add_argument('--model', default='llama3.1')
+    parser.add_argument('--ttft', type=float, default=0.3, help="fake server time to first token")
+    parser.add_argument('--rate', type=float, default=40.0, help="fake server tokens per second")
+    parser.add_argument('--tokens', type=int, default=120, help="tokens per fake response")
+    parser.add_argument('--jitter', type=float, default=0.2, help="relative jitter of the fake TTFT")
+    parser.add_argument('--max-in-flight', type=int, default=4, help="gateway slots per host")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    server, host = start_fake_server(args)
+    os.environ['OLLAMA_HOSTS'] = host
+    os.environ['OLLAMA_MAX_IN_FLIGHT'] = str(args.max_in_flight)
+    os.environ.setdefault('RESPONSE_CACHE_TTL', '0')
+
+    results = {'ttft': [], 'latency': [], 'deltas': [], 'rejected': 0}
+    lock = threading.Lock()
+    try:
+        usage_before = resource.getrusage(resource.RUSAGE_SELF)
+        wall_started = time.perf_counter()
+        threads = [
+            threading.Thread(target=simulate_session, args=(i, args, results, lock))
+            for i in range(args.sessions)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - wall_started
+        usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    finally:
+        server.terminate()
+        server.wait()
+
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    turns = len(results['latency'])
+    report = {
+        'sessions': args.sessions,
+        'turns': turns,
+        'rejected': results['rejected'],
+        'wall_seconds': wall,
+        'ttft_p50': percentile(results['ttft'], 50),
+        'ttft_p95': percentile(results['ttft'], 95),
+        'ttft_p99': percentile(results['ttft'], 99),
+        'latency_p50': percentile(results['latency'], 50),
+        'latency_p95': percentile(results['latency'], 95),
+        'latency_p99': percentile(results['latency'], 99),
+        'deltas_per_turn': sum(results['deltas']) / turns if turns else 0,
+        'cpu_seconds': cpu,
+        'cpu_ms_per_turn': cpu / turns * 1000 if turns else 0,
+        # ru_maxrss is in KiB on Linux.
+        'peak_rss_mb': usage_after.ru_maxrss / 1024,
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['sessions']} sessions, {turns} turns, {report['rejected']} rejected, {wall:.1f}s wall")
+    print(f"TTFT     p50 {report['ttft_p50']:.3f}s  p95 {report['ttft_p95']:.3f}s  p99 {report['ttft_p99']:.3f}s")
+    print(f"latency  p50 {report['latency_p50']:.3f}s  p95 {report['latency_p95']:.3f}s  p99 {report['latency_p99']:.3f}s")
+    print(f"server   {cpu:.2f}s CPU ({report['cpu_ms_per_turn']:.1f} ms/turn), peak RSS {report['peak_rss_mb']:.0f} MB, "
+          f"{report['deltas_per_turn']:.0f} placeholder updates/turn")
+
+
+if __name__ == '__main__':
+    main()
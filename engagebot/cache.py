@@ -0,0 +1,113 @@
+"""Opt-in response cache for repeated first turns.
+
+Many students open an interaction and send an almost identical first message
+("hi", "ready", "let's start"), which triggers the same generation against the
+same system prompt. When enabled (``RESPONSE_CACHE_TTL`` > 0), responses are
+cached per process keyed on the interaction, the model and a hash of the
+normalized message history, so any divergence in the history is a miss.
+Entries expire after the TTL and the least recently used ones are evicted
+once the cache is full.
+"""
+import hashlib
+import json
+import os
+import re
+import string
+import threading
+import time
+from collections import OrderedDict
+
+# Only conversations with at most this many student turns are cached; later
+# turns are practically never repeated and would just churn the cache.
+MAX_USER_TURNS = 2
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(text: str) -> str:
+    """Fold case, whitespace and surrounding punctuation so near-identical messages match."""
+    return _WHITESPACE.sub(' ', text).strip().strip(string.punctuation + ' ').lower()
+
+
+def history_hash(messages) -> str:
+    normalized = [(message['role'], normalize(message['content'])) for message in messages]
+    return hashlib.sha256(json.dumps(normalized).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe LRU cache with per-entry TTL."""
+
+    def __init__(self, ttl: float, max_entries: int, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, interaction, model: str, messages) -> tuple:
+        return (interaction, model, history_hash(messages))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, response: str):
+        with self._lock:
+            self._entries[key] = (response, self.clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def cacheable(messages) -> bool:
+    return sum(1 for message in messages if message['role'] == 'user') <= MAX_USER_TURNS
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide cache, or None when caching is disabled."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            ttl = float(os.getenv('RESPONSE_CACHE_TTL', '0'))
+            if ttl <= 0:
+                return None
+            _cache = ResponseCache(ttl, int(os.getenv('RESPONSE_CACHE_SIZE', '512')))
+        return _cache
+
+
+def cached_stream(response: str):
+    """Replay a cached response as a single Ollama-style chunk."""
+    yield {'message': {'role': 'assistant', 'content': response}, 'done': True}
+
+
+def caching_stream(stream, cache: ResponseCache, key):
+    """Pass chunks through and cache the full response once the stream completes.
+
+    A response from another model than the one in ``key`` (the gateway fell
+    back after a missed time-to-first-token deadline) is not cached, so later
+    students still get the primary model's answer.
+    """
+    _, model, _ = key
+    parts = []
+    for chunk in stream:
+        parts.append(chunk['message']['content'])
+        if chunk.get('done') and chunk.get('model', model) == model:
+            cache.put(key, ''.join(parts))
+        yield chunk
@@ -0,0 +1,44 @@
+"""Process-wide Ollama clients with pooled keep-alive connections.
+
+Streamlit re-executes the interaction script on every rerun, so a client built
+at module level of the script is rebuilt (and its connection pool thrown away)
+for every submitted message. Clients returned from here live for the lifetime
+of the process and are shared by every session.
+"""
+import os
+import threading
+
+import httpx
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def client_options() -> dict:
+    """Keyword arguments passed through to the underlying httpx client."""
+    # Read at call time so values loaded from .env by the script are honoured.
+    pool_size = int(os.getenv('OLLAMA_POOL_SIZE', '32'))
+    keepalive = int(os.getenv('OLLAMA_KEEPALIVE_CONNECTIONS', str(pool_size)))
+    return {
+        'timeout': httpx.Timeout(
+            float(os.getenv('OLLAMA_READ_TIMEOUT', '300')),
+            connect=float(os.getenv('OLLAMA_CONNECT_TIMEOUT', '5')),
+        ),
+        'limits': httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=keepalive,
+            keepalive_expiry=float(os.getenv('OLLAMA_KEEPALIVE_EXPIRY', '300')),
+        ),
+    }
+
+
+def get_client(host: str):
+    """Return the shared ``ollama.Client`` for a host, creating it on first use."""
+    # Imported here: the pages only use the gateway's async clients, built on the first request.
+    from ollama import Client
+
+    with _lock:
+        client = _clients.get(host)
+        if client is None:
+            client = _clients[host] = Client(host=host, **client_options())
+        return client
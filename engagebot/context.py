@@ -0,0 +1,85 @@
+"""Keep the prompt sent to the model within a token budget.
+
+Every turn used to send the whole of ``st.session_state["messages"]``, so
+prefill cost grew with the conversation until it overflowed the model's
+context window. ``fit_messages`` always keeps the head of the conversation
+(the system prompt and the initial question list) and the most recent turns,
+and drops the middle once the budget is exceeded.
+"""
+import functools
+import os
+
+# Messages at the start of the conversation that are never dropped: the
+# system prompt and the initial message listing the questions.
+HEAD_MESSAGES = 2
+
+# Note inserted where older turns were dropped, so the model knows the
+# conversation did not start at the first kept turn.
+TRIMMED_NOTE = "(Earlier parts of this conversation were omitted to save space.)"
+
+# Tokens added per message by the chat template (role markers and separators).
+MESSAGE_OVERHEAD = 4
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    # tiktoken does not ship llama's tokenizer, but cl100k_base is close enough
+    # for budgeting. Loading it can fail on hosts without internet access, in
+    # which case fall back to a character estimate.
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+@functools.lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Token count of a piece of text, cached across reruns and sessions."""
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def message_tokens(message: dict) -> int:
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def default_budget() -> int:
+    return int(os.getenv('CONTEXT_TOKEN_BUDGET', '3000'))
+
+
+def fit_messages(messages, budget=None, head=HEAD_MESSAGES) -> list:
+    """Return the messages to send, trimmed from the middle to fit ``budget`` tokens."""
+    if budget is None:
+        budget = default_budget()
+
+    head_messages = list(messages[:head])
+    tail_messages = list(messages[head:])
+
+    used = sum(message_tokens(message) for message in head_messages)
+    total = used + sum(message_tokens(message) for message in tail_messages)
+    if total <= budget:
+        return head_messages + tail_messages
+
+    # Reserve room for the note, then keep the newest turns that still fit.
+    # The latest message is always kept, even if it alone exceeds the budget.
+    note = {"role": "system", "content": TRIMMED_NOTE}
+    used += message_tokens(note)
+    kept = []
+    for message in reversed(tail_messages):
+        cost = message_tokens(message)
+        if kept and used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+
+    # Start the kept window on a user turn so roles still alternate.
+    while len(kept) > 1 and kept[0]["role"] != "user":
+        kept.pop(0)
+
+    if len(kept) == len(tail_messages):
+        return head_messages + kept
+    return head_messages + [note] + kept
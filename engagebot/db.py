@@ -0,0 +1,72 @@
+"""Process-wide PostgreSQL connection pool.
+
+Every session of every interaction process used to open its own connection,
+which ran into the server's ``max_connections`` during class. All database
+access now borrows from one ``psycopg_pool.ConnectionPool`` per process, so the
+total is bounded by ``PG_POOL_MAX_SIZE`` times the number of processes no
+matter how many students are connected.
+"""
+import os
+import threading
+
+from engagebot.telemetry import metric_sources, start_metrics_server
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# psycopg_pool statistics exported on the metrics endpoint.
+_POOL_STATS = (
+    ('pool_min', 'gauge', 'Minimum connections kept open.'),
+    ('pool_max', 'gauge', 'Maximum connections allowed.'),
+    ('pool_size', 'gauge', 'Connections currently open.'),
+    ('pool_available', 'gauge', 'Idle connections ready to be borrowed.'),
+    ('requests_waiting', 'gauge', 'Callers waiting for a connection.'),
+    ('requests_num', 'counter', 'Connections requested.'),
+    ('requests_queued', 'counter', 'Requests that had to wait for a connection.'),
+    ('requests_wait_ms', 'counter', 'Total time spent waiting for a connection.'),
+    ('requests_errors', 'counter', 'Requests that failed to get a connection.'),
+    ('connections_num', 'counter', 'Connection attempts to the server.'),
+    ('connections_errors', 'counter', 'Failed connection attempts.'),
+)
+
+
+def default_connection_string() -> str:
+    """Connection string built from the ``PG_*`` settings, as the interaction scripts do."""
+    return "postgresql://{pg_user}:{pg_pass}@{pg_host}/{pg_db}".format(
+        pg_user=os.getenv('PG_USER'),
+        pg_pass=os.getenv('PG_PASS'),
+        pg_host=os.getenv('PG_HOST'),
+        pg_db=os.getenv('PG_DB'),
+    )
+
+
+def get_pool(connection_string: str):
+    """Return the shared pool for a database, opening it on first use."""
+    from psycopg_pool import ConnectionPool
+
+    with _pools_lock:
+        pool = _pools.get(connection_string)
+        if pool is None:
+            pool = _pools[connection_string] = ConnectionPool(
+                connection_string,
+                min_size=int(os.getenv('PG_POOL_MIN_SIZE', '1')),
+                max_size=int(os.getenv('PG_POOL_MAX_SIZE', '4')),
+                timeout=float(os.getenv('PG_POOL_TIMEOUT', '30')),
+                name=f'engagebot-{len(_pools)}',
+                open=True,
+            )
+            metric_sources.append(lambda: render_pool_metrics(pool))
+            start_metrics_server()
+        return pool
+
+
+def render_pool_metrics(pool) -> str:
+    """psycopg_pool statistics in the Prometheus text format."""
+    stats = pool.get_stats()
+    lines = []
+    for name, kind, help_text in _POOL_STATS:
+        metric = f'engagebot_pg_{name}' + ('_total' if kind == 'counter' else '')
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        lines.append(f'{metric}{{pool="{pool.name}"}} {stats.get(name, 0)}')
+    return '\n'.join(lines) + '\n'
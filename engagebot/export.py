@@ -0,0 +1,237 @@
+"""Export chat transcripts for research, in constant memory.
+
+    python -m engagebot.export --out exports/ [--format parquet|csv]
+        [--course nsc396a] [--week 3] [--interaction 2]
+        [--start 2026-01-01] [--end 2026-05-01] [--incremental]
+
+Rows of ``chat_messages`` are read through a server-side cursor in
+``--batch-size`` chunks, ordered by course, week and time, and written to one
+file per course and week as they arrive:
+
+    exports/course=nsc396a/week=3/part-000000000001.parquet
+
+(the directory layout is the Hive partitioning that pandas, pyarrow and
+DuckDB read as a single dataset). Course and week are only in the directory
+names, not in the files: readers add them as columns from there, and reject a
+dataset whose files also have them. Only one file is open at a time and at
+most one batch is held in memory, however many rows match.
+
+``--incremental`` only exports rows added since the previous incremental run
+into ``--out``, and each run writes new ``part-`` files next to the earlier
+ones. Rows are selected by ``inserted_at`` rather than by id: every worker
+process writes its own batches, and a batch that commits after a
+later-numbered one from another process would fall below an id cursor and
+never be exported. Each run only takes rows inserted more than
+``--settle-seconds`` ago (by the database clock), so every transaction that
+could still add rows before that point has committed, and keeps that time in
+``.export-state.json`` as where the next run starts.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import date, datetime
+from itertools import groupby
+
+from dotenv import load_dotenv
+
+from engagebot.db import default_connection_string, get_pool
+from engagebot.schema import TABLE_NAME, ensure_schema
+
+EXPORT_COLUMNS = ('id', 'session_id', 'course', 'week', 'interaction', 'role', 'content', 'ts', 'prompt_hash')
+# Encoded in the directory names; the files hold the other columns.
+PARTITION_COLUMNS = ('course', 'week')
+FILE_COLUMNS = tuple(name for name in EXPORT_COLUMNS if name not in PARTITION_COLUMNS)
+_FILE_INDEXES = tuple(EXPORT_COLUMNS.index(name) for name in FILE_COLUMNS)
+_PARTITION_INDEXES = tuple(EXPORT_COLUMNS.index(name) for name in PARTITION_COLUMNS)
+
+# Directory value Hive readers (pyarrow, DuckDB) read back as null.
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+STATE_FILE = '.export-state.json'
+
+
+def build_query(course=None, week=None, interaction=None, start=None, end=None,
+                inserted_after=None, inserted_before=None, after_id=0):
+    """SELECT over ``chat_messages`` with the given filters, grouped by course and week."""
+    conditions = ['id > %(after_id)s']
+    params = {'after_id': after_id}
+    if inserted_after is not None:
+        conditions.append('inserted_at >= %(inserted_after)s')
+        params['inserted_after'] = inserted_after
+    if inserted_before is not None:
+        conditions.append('inserted_at < %(inserted_before)s')
+        params['inserted_before'] = inserted_before
+    for name, value in (('course', course), ('week', week), ('interaction', interaction)):
+        if value is not None:
+            conditions.append(f'{name} = %({name})s')
+            params[name] = value
+    if start is not None:
+        conditions.append('ts >= %(start)s')
+        params['start'] = start
+    if end is not None:
+        conditions.append('ts < %(end)s')
+        params['end'] = end
+    query = (
+        f"SELECT {', '.join(EXPORT_COLUMNS)} FROM {TABLE_NAME} "
+        f"WHERE {' AND '.join(conditions)} "
+        "ORDER BY course, week, ts, id"
+    )
+    return query, params
+
+
+class CsvPartWriter:
+    def __init__(self, path: str):
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(FILE_COLUMNS)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetPartWriter:
+    def __init__(self, path: str):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self.schema = pa.schema([
+            ('id', pa.int64()),
+            ('session_id', pa.string()),
+            ('interaction', pa.string()),
+            ('role', pa.string()),
+            ('content', pa.string()),
+            ('ts', pa.timestamp('us')),
+            ('prompt_hash', pa.string()),
+        ])
+        self._writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, rows):
+        # Each batch becomes one row group.
+        columns = list(zip(*rows))
+        self._writer.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema,
+        ))
+
+    def close(self):
+        self._writer.close()
+
+
+WRITERS = {'csv': CsvPartWriter, 'parquet': ParquetPartWriter}
+
+
+def _partition_path(out: str, course, week, first_id: int, file_format: str) -> str:
+    directory = os.path.join(out, f'course={course or NULL_PARTITION}', f'week={week or NULL_PARTITION}')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f'part-{first_id:012d}.{file_format}')
+
+
+def load_state(out: str) -> dict:
+    try:
+        with open(os.path.join(out, STATE_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(out: str, state: dict):
+    path = os.path.join(out, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def settled_before(connection_string: str, settle_seconds: float):
+    """Database time ``settle_seconds`` ago; rows inserted before it are all committed."""
+    with get_pool(connection_string).connection() as connection:
+        ensure_schema(connection)
+        return connection.execute(
+            "SELECT now() - make_interval(secs => %s)", (settle_seconds,)
+        ).fetchone()[0]
+
+
+def export(connection_string: str, out: str, file_format='parquet', batch_size=10000, **filters) -> dict:
+    """Stream matching rows into per-course/week files; returns row and file counts."""
+    query, params = build_query(**filters)
+    writer_class = WRITERS[file_format]
+    os.makedirs(out, exist_ok=True)
+
+    summary = {'rows': 0, 'files': 0}
+    current_key = writer = None
+    started = time.monotonic()
+    # Named (server-side) cursors only live inside a transaction, which the pool provides.
+    with get_pool(connection_string).connection() as connection:
+        with connection.cursor(name='engagebot_export') as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(query, params)
+            try:
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    # Rows arrive ordered by (course, week), so each group is contiguous.
+                    for key, rows in groupby(batch, key=lambda row: tuple(row[i] for i in _PARTITION_INDEXES)):
+                        rows = [tuple(row[i] for i in _FILE_INDEXES) for row in rows]
+                        if key != current_key:
+                            if writer is not None:
+                                writer.close()
+                            writer = writer_class(_partition_path(out, *key, rows[0][0], file_format))
+                            current_key = key
+                            summary['files'] += 1
+                        writer.write(rows)
+                    summary['rows'] += len(batch)
+                    print(f"exported {summary['rows']} rows to {summary['files']} files "
+                          f"({time.monotonic() - started:.1f}s)", file=sys.stderr, flush=True)
+            finally:
+                if writer is not None:
+                    writer.close()
+    return summary
+
+
+def main(argv=None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Export chat transcripts to Parquet or CSV.")
+    parser.add_argument('--out', required=True, help="output directory")
+    parser.add_argument('--format', choices=sorted(WRITERS), default='parquet')
+    parser.add_argument('--course')
+    parser.add_argument('--week')
+    parser.add_argument('--interaction')
+    parser.add_argument('--start', type=date.fromisoformat, help="first day included (YYYY-MM-DD)")
+    parser.add_argument('--end', type=date.fromisoformat, help="first day excluded (YYYY-MM-DD)")
+    parser.add_argument('--incremental', action='store_true', help="only rows added since the last incremental run")
+    parser.add_argument('--settle-seconds', type=float, default=300,
+                        help="with --incremental, leave rows inserted this recently for the next run")
+    parser.add_argument('--batch-size', type=int, default=10000, help="rows fetched and written at a time")
+    args = parser.parse_args(argv)
+
+    filters = {'course': args.course, 'week': args.week, 'interaction': args.interaction,
+               'start': args.start, 'end': args.end}
+    recorded_filters = {name: str(value) for name, value in filters.items() if value is not None}
+    window = {}
+    if args.incremental:
+        state = load_state(args.out)
+        # The saved position only applies to the filters it was recorded with.
+        if state.get('filters') == recorded_filters and 'inserted_before' in state:
+            window['inserted_after'] = datetime.fromisoformat(state['inserted_before'])
+        elif state.get('filters') == recorded_filters and 'max_id' in state:
+            # State of an export made before rows had inserted_at: continue after its last id once.
+            window['after_id'] = state['max_id']
+        window['inserted_before'] = settled_before(default_connection_string(), args.settle_seconds)
+
+    summary = export(default_connection_string(), args.out, args.format, args.batch_size, **filters, **window)
+    print(f"export: {summary['rows']} rows in {summary['files']} files under {args.out}")
+
+    if args.incremental:
+        save_state(args.out, {'inserted_before': window['inserted_before'].isoformat(), 'filters': recorded_filters})
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
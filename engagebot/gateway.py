@@ -0,0 +1,513 @@
+"""Asyncio inference gateway shared by every session in the process.
+
+Streamlit runs each session's script on its own thread, so calling
+``client.chat(..., stream=True)`` directly lets every connected student open a
+request against Ollama at the same time. The gateway instead runs a single
+event loop on a background thread and talks to Ollama through
+``ollama.AsyncClient``:
+
+- requests are spread over the hosts in ``OLLAMA_HOSTS`` by
+  ``engagebot.router`` and fail over when a host is unreachable,
+- each backend host has a cap on in-flight requests,
+- a turn whose first token misses its time-to-first-token deadline is
+  cancelled and retried on a fallback model or another host,
+- requests over the cap wait in per-session queues that are served
+  round-robin, so one session cannot starve the others,
+- tokens are handed back to the calling script thread as a plain iterator,
+- the final chunk of each stream (which carries Ollama's timing counters) is
+  passed to the gateway's completion hooks.
+
+Admission control sits in front of the queues: callers are told their queue
+position while they wait, and requests are shed with ``GatewayBusy`` once a
+backend's queue is full or a request has waited longer than allowed.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+import httpx
+
+from engagebot.cache import cacheable, cached_stream, caching_stream, get_response_cache
+from engagebot.client import client_options
+from engagebot.prefix import prefix_options
+from engagebot.router import BackendRouter, configured_hosts
+from engagebot.telemetry import metric_sources, start_metrics_server, telemetry
+
+logger = logging.getLogger(__name__)
+
+# Marker put on a request's output queue when the stream is finished.
+_DONE = object()
+
+# Weight of the newest sample in the moving average of queue wait time.
+_WAIT_SMOOTHING = 0.2
+
+
+class GatewayBusy(Exception):
+    """Raised to the caller when a request is shed instead of queued."""
+
+
+class _Position:
+    """Queue position update put on a waiting request's output queue."""
+
+    def __init__(self, position: int):
+        self.position = position
+
+
+class _Request:
+    """A single chat turn waiting for, or holding, a backend slot."""
+
+    def __init__(self, session_id, model, messages, tags, kwargs):
+        self.session_id = session_id
+        self.tags = tags
+        self.model = model
+        self.messages = messages
+        self.kwargs = kwargs
+        self.out = queue.Queue()
+        self.task = None
+        self.finished = False
+        self.position = None
+        self.backend = None
+        self.host = None
+        self.tried = []
+
+        # Time-to-first-token budget and what to do when it is missed.
+        self.ttft_deadline = None
+        self.fallback_model = None
+        self.fell_back = False
+        self.started_at = None
+        self.first_token_at = None
+        self.enqueued_at = time.monotonic()
+
+
+class Backend:
+    """Concurrency limit and fair wait queue for one Ollama host."""
+
+    def __init__(self, host: str, max_in_flight: int, max_queue: int, client):
+        self.host = host
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.client = client
+        self.in_flight = 0
+        self.healthy = True
+
+        # session_id -> deque of waiting requests, in round-robin order.
+        self.waiting = OrderedDict()
+
+        # Admission statistics.
+        self.admitted = 0
+        self.rejected = 0
+        self.avg_wait = 0.0
+        self.last_wait = 0.0
+
+    @property
+    def queued(self) -> int:
+        return sum(len(requests) for requests in self.waiting.values())
+
+    def service_order(self) -> list:
+        """Waiting requests in the order they will be dispatched."""
+        order = []
+        depth = 0
+        while True:
+            row = [requests[depth] for requests in self.waiting.values() if len(requests) > depth]
+            if not row:
+                return order
+            order.extend(row)
+            depth += 1
+
+    def record_wait(self, request: _Request):
+        self.admitted += 1
+        self.last_wait = time.monotonic() - request.enqueued_at
+        self.avg_wait += _WAIT_SMOOTHING * (self.last_wait - self.avg_wait)
+
+    def oldest_wait(self) -> float:
+        if not self.waiting:
+            return 0.0
+        now = time.monotonic()
+        return max(now - requests[0].enqueued_at for requests in self.waiting.values())
+
+    def enqueue(self, request: _Request):
+        self.waiting.setdefault(request.session_id, deque()).append(request)
+
+    def remove(self, request: _Request) -> bool:
+        requests = self.waiting.get(request.session_id)
+        if not requests or request not in requests:
+            return False
+        requests.remove(request)
+        if not requests:
+            del self.waiting[request.session_id]
+        return True
+
+    def next_request(self):
+        """Pop the oldest request of the next session in round-robin order."""
+        if not self.waiting:
+            return None
+        session_id, requests = self.waiting.popitem(last=False)
+        request = requests.popleft()
+        if requests:
+            # The session goes to the back of the line for its next request.
+            self.waiting[session_id] = requests
+        return request
+
+
+def _default_client_factory(host: str):
+    from ollama import AsyncClient
+    return AsyncClient(host=host, **client_options())
+
+
+class InferenceGateway:
+    """Run chat requests on a background event loop with bounded concurrency."""
+
+    def __init__(self, hosts=None, max_in_flight=None, max_queue=None, max_wait=None,
+                 client_factory=_default_client_factory):
+        if max_in_flight is None:
+            max_in_flight = int(os.getenv('OLLAMA_MAX_IN_FLIGHT', '4'))
+        if max_queue is None:
+            max_queue = int(os.getenv('OLLAMA_MAX_QUEUE', '32'))
+        if max_wait is None:
+            max_wait = float(os.getenv('OLLAMA_MAX_QUEUE_WAIT', '120'))
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.client_factory = client_factory
+        self.backends = {}
+        self.router = BackendRouter(self._backend(host) for host in (hosts or configured_hosts()))
+
+        # Called on the loop thread with (request, final_chunk) after each stream.
+        self.completion_hooks = [telemetry.record]
+
+        # (course, week, interaction, model, fallback) -> missed TTFT deadlines.
+        self.fallbacks = Counter()
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='engagebot-gateway', daemon=True)
+        self._thread.start()
+        self._loop.call_soon_threadsafe(self.router.start, self._loop)
+
+    def chat(self, host, model: str, messages, session_id=None, on_queued=None, tags=None,
+             ttft_deadline=None, fallback_model=None, **kwargs):
+        """Queue a streaming chat request and iterate over its chunks.
+
+        With ``host`` set to None the router picks the host; otherwise the
+        request is pinned to ``host``.
+
+        ``on_queued(position)`` is called on the caller's thread whenever the
+        request's place in the queue changes while it waits for a slot, and
+        with 0 once a request that had to wait is given one.
+        ``tags`` (course, week, interaction) label the request for the
+        completion hooks.
+
+        If no token arrives within ``ttft_deadline`` seconds of the request
+        reaching Ollama, it is cancelled and retried once, on
+        ``fallback_model`` if given or else on another host.
+        """
+        # Copy the history so later edits by the script cannot race the request.
+        request = _Request(session_id, model, list(messages), dict(tags or {}), kwargs)
+        request.host = host
+        request.ttft_deadline = ttft_deadline
+        request.fallback_model = fallback_model
+        self._loop.call_soon_threadsafe(self._submit, request)
+        return self._iterate(request, on_queued)
+
+    def stats(self) -> dict:
+        """Queue depth, load and wait time per backend host."""
+        return self._call_on_loop(self._collect_stats)
+
+    def fallback_stats(self) -> dict:
+        """Missed TTFT deadlines keyed by (course, week, interaction, model, fallback)."""
+        return self._call_on_loop(lambda: dict(self.fallbacks))
+
+    def render_metrics(self) -> str:
+        """Queue gauges and fallback counters in the Prometheus text format."""
+        stats = self.stats()
+        fallbacks = self.fallback_stats()
+        lines = []
+        for name, key, kind, help_text in (
+            ('up', 'healthy', 'gauge', 'Whether the host passed its last health check.'),
+            ('in_flight', 'in_flight', 'gauge', 'Requests currently streaming.'),
+            ('queued', 'queued', 'gauge', 'Requests waiting for a slot.'),
+            ('avg_queue_wait_seconds', 'avg_wait_seconds', 'gauge', 'Moving average of queue wait.'),
+            ('oldest_queue_wait_seconds', 'oldest_wait_seconds', 'gauge', 'Wait of the oldest queued request.'),
+            ('admitted_total', 'admitted', 'counter', 'Requests given a slot.'),
+            ('rejected_total', 'rejected', 'counter', 'Requests shed by admission control.'),
+        ):
+            metric = f'engagebot_backend_{name}'
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} {kind}')
+            for host, values in stats.items():
+                lines.append(f'{metric}{{host="{host}"}} {float(values[key]):g}')
+
+        metric = 'engagebot_ttft_fallbacks_total'
+        lines.append(f'# HELP {metric} Turns retried after missing the time-to-first-token deadline.')
+        lines.append(f'# TYPE {metric} counter')
+        for (course, week, interaction, model, fallback), count in fallbacks.items():
+            lines.append(
+                f'{metric}{{course="{course}",week="{week}",interaction="{interaction}",'
+                f'model="{model}",fallback="{fallback}"}} {count}'
+            )
+        return '\n'.join(lines) + '\n'
+
+    def _call_on_loop(self, fn):
+        # Collect on the loop thread so the queues are not read mid-update.
+        result = concurrent.futures.Future()
+        self._loop.call_soon_threadsafe(lambda: result.set_result(fn()))
+        return result.result(timeout=5)
+
+    def _collect_stats(self) -> dict:
+        return {
+            host: {
+                'healthy': backend.healthy,
+                'in_flight': backend.in_flight,
+                'max_in_flight': backend.max_in_flight,
+                'queued': backend.queued,
+                'max_queue': backend.max_queue,
+                'admitted': backend.admitted,
+                'rejected': backend.rejected,
+                'avg_wait_seconds': backend.avg_wait,
+                'last_wait_seconds': backend.last_wait,
+                'oldest_wait_seconds': backend.oldest_wait(),
+            }
+            for host, backend in self.backends.items()
+        }
+
+    def _iterate(self, request: _Request, on_queued):
+        try:
+            while True:
+                item = request.out.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                if isinstance(item, _Position):
+                    if on_queued is not None:
+                        on_queued(item.position)
+                    continue
+                yield item
+        finally:
+            # Free the slot (or the queue entry) if the caller stopped early.
+            if not request.finished:
+                self._loop.call_soon_threadsafe(self._cancel, request)
+
+    # Everything below runs on the gateway's event loop thread.
+
+    def _backend(self, host: str) -> Backend:
+        backend = self.backends.get(host)
+        if backend is None:
+            backend = self.backends[host] = Backend(
+                host, self.max_in_flight, self.max_queue, self.client_factory(host))
+        return backend
+
+    def _submit(self, request: _Request):
+        if request.finished:
+            return
+        if request.host is not None:
+            backend = self._backend(request.host)
+        else:
+            backend = self.router.pick(exclude=request.tried)
+        if backend is None:
+            request.finished = True
+            request.out.put(GatewayBusy('no reachable ollama host'))
+            return
+        request.backend = backend
+
+        # Shed load instead of letting the queue grow until requests time out.
+        if backend.in_flight >= backend.max_in_flight and backend.queued >= backend.max_queue:
+            self._reject(backend, request, 'queue is full')
+            return
+
+        backend.enqueue(request)
+        self._loop.call_later(self.max_wait, self._expire, backend, request)
+        self._dispatch(backend)
+
+    def _dispatch(self, backend: Backend):
+        while backend.in_flight < backend.max_in_flight:
+            request = backend.next_request()
+            if request is None:
+                break
+            backend.in_flight += 1
+            backend.record_wait(request)
+            if request.position is not None:
+                # Position 0: the request left the queue and is running.
+                request.position = 0
+                request.out.put(_Position(0))
+            request.task = self._loop.create_task(self._run(backend, request))
+        self._announce_positions(backend)
+
+    def _announce_positions(self, backend: Backend):
+        for position, request in enumerate(backend.service_order(), start=1):
+            if request.position != position:
+                request.position = position
+                request.out.put(_Position(position))
+
+    def _reject(self, backend: Backend, request: _Request, reason: str):
+        backend.rejected += 1
+        request.finished = True
+        request.out.put(GatewayBusy(f'{backend.host}: {reason}'))
+
+    def _expire(self, backend: Backend, request: _Request):
+        if backend.remove(request):
+            self._reject(backend, request, f'waited more than {self.max_wait:g}s for a slot')
+            self._announce_positions(backend)
+
+    def _cancel(self, request: _Request):
+        backend = request.backend
+        if backend is None:
+            # Not routed yet; _submit will see the request is finished.
+            request.finished = True
+        elif backend.remove(request):
+            request.finished = True
+            self._announce_positions(backend)
+        elif request.task is not None:
+            request.task.cancel()
+
+    async def _run(self, backend: Backend, request: _Request):
+        delivered = False
+        retry = False
+        request.started_at = time.monotonic()
+        try:
+            stream = await backend.client.chat(
+                model=request.model,
+                messages=request.messages,
+                stream=True,
+                **request.kwargs,
+            )
+            chunks = aiter(stream)
+
+            if self._can_fall_back(request):
+                try:
+                    chunk = await asyncio.wait_for(anext(chunks, _DONE), request.ttft_deadline)
+                except asyncio.TimeoutError:
+                    await self._close(chunks)
+                    self._fall_back(backend, request)
+                    retry = True
+                    return
+            else:
+                chunk = await anext(chunks, _DONE)
+
+            final_chunk = None
+            while chunk is not _DONE:
+                if not delivered:
+                    request.first_token_at = time.monotonic()
+                    delivered = True
+                request.out.put(chunk)
+                if chunk.get('done'):
+                    final_chunk = chunk
+                chunk = await anext(chunks, _DONE)
+            request.out.put(_DONE)
+            if final_chunk is not None:
+                self._completed(request, final_chunk)
+        except asyncio.CancelledError:
+            request.out.put(_DONE)
+        except httpx.TransportError as e:
+            # The host is unreachable: take it out of rotation and, if nothing
+            # was streamed yet, send the turn to another host.
+            self.router.mark_down(backend, e)
+            request.tried.append(backend)
+            retry = not delivered and request.host is None and len(request.tried) < len(self.router.backends)
+            if not retry:
+                request.out.put(e)
+        except Exception as e:
+            request.out.put(e)
+        finally:
+            backend.in_flight -= 1
+            if retry:
+                request.position = None
+                self._submit(request)
+            else:
+                request.finished = True
+            self._dispatch(backend)
+
+    def _can_fall_back(self, request: _Request) -> bool:
+        if not request.ttft_deadline or request.fell_back:
+            return False
+        if request.fallback_model and request.fallback_model != request.model:
+            return True
+        return request.host is None and len(request.tried) + 1 < len(self.router.backends)
+
+    def _fall_back(self, backend: Backend, request: _Request):
+        """Record a missed TTFT deadline and point the request at its fallback."""
+        request.fell_back = True
+        if request.fallback_model and request.fallback_model != request.model:
+            fallback = f'model:{request.fallback_model}'
+            original, request.model = request.model, request.fallback_model
+        else:
+            fallback = 'host'
+            original = request.model
+            request.tried.append(backend)
+        self.fallbacks[(
+            request.tags.get('course'), request.tags.get('week'), request.tags.get('interaction'),
+            original, fallback,
+        )] += 1
+        logger.warning(
+            "no first token from %s on %s within %gs, falling back to %s",
+            original, backend.host, request.ttft_deadline, fallback,
+        )
+
+    @staticmethod
+    async def _close(chunks):
+        # Drop the abandoned stream so its connection goes back to the pool.
+        try:
+            await chunks.aclose()
+        except Exception:
+            pass
+
+    def _completed(self, request: _Request, final_chunk):
+        for hook in self.completion_hooks:
+            try:
+                hook(request, final_chunk)
+            except Exception:
+                logger.exception("completion hook %r failed", hook)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> InferenceGateway:
+    """Return the process-wide gateway, starting its event loop on first use."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = InferenceGateway()
+            metric_sources.append(_gateway.render_metrics)
+            start_metrics_server()
+        return _gateway
+
+
+def chat_stream(model: str, messages, session_id=None, on_queued=None, tags=None, host=None,
+                ttft_deadline=None, fallback_model=None, **kwargs):
+    """Stream a chat response through the shared gateway.
+
+    The model is kept loaded and the static head of the conversation pinned
+    (see ``engagebot.prefix``) unless the caller passes its own options.
+    Repeated early turns may be answered from ``engagebot.cache``.
+    """
+    # Serve repeated early turns from the response cache when it is enabled.
+    cache = get_response_cache()
+    if cache is not None and cacheable(messages):
+        tags = tags or {}
+        key = cache.key((tags.get('course'), tags.get('week'), tags.get('interaction')), model, messages)
+        response = cache.get(key)
+        if response is not None:
+            return cached_stream(response)
+    else:
+        cache = None
+
+    # Time-to-first-token budget: per call, or the process default from .env.
+    if ttft_deadline is None:
+        ttft_deadline = float(os.getenv('OLLAMA_TTFT_DEADLINE', '0')) or None
+    if fallback_model is None:
+        fallback_model = os.getenv('OLLAMA_FALLBACK_MODEL') or None
+
+    for name, value in prefix_options(messages).items():
+        kwargs.setdefault(name, value)
+    stream = get_gateway().chat(
+        host, model, messages, session_id=session_id, on_queued=on_queued, tags=tags,
+        ttft_deadline=ttft_deadline, fallback_model=fallback_model, **kwargs)
+    if cache is not None:
+        return caching_stream(stream, cache, key)
+    return stream
@@ -0,0 +1,284 @@
+"""Durable, batched writes of chat history to PostgreSQL.
+
+``PostgresChatMessageHistory.add_message`` ran one INSERT per message on the
+Streamlit script thread, so database latency was added to every turn, and an
+unreachable database broke the page. Instead:
+
+- ``add_message`` appends the message to a local SQLite spool (write-ahead,
+  WAL mode) and returns; nothing waits on PostgreSQL,
+- one background thread per process drains the spool in order and writes
+  everything that arrived within a few milliseconds, from all sessions, as
+  one multi-row INSERT with a connection borrowed from ``engagebot.db``,
+- while PostgreSQL is slow or down, messages stay in the spool and are
+  replayed in bulk once it is back. Rows are deleted from the spool only
+  after PostgreSQL has committed them.
+
+Each message gets a UUID when it is spooled, and PostgreSQL ignores ids it
+already has, so replaying a batch twice (after a crash, or when two processes
+drain the same spool) never duplicates rows. Rows go to the typed
+``chat_messages`` table described in ``engagebot.schema``. System prompts are
+spooled once by ``add_prompt`` and written to ``system_prompts`` together with
+the first batch of messages that references them.
+"""
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from langchain_core.messages import message_to_dict
+
+from engagebot.db import get_pool
+from engagebot.schema import COLUMNS, PROMPTS_TABLE, TABLE_NAME, ensure_schema, message_row, prompt_hash
+from engagebot.telemetry import metric_sources, start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+# Longest pause between retries while PostgreSQL is unavailable.
+MAX_RETRY_DELAY = 30.0
+
+
+def default_spool_path() -> str:
+    return os.getenv('HISTORY_SPOOL_PATH', os.path.join('.spool', 'history.sqlite'))
+
+
+class HistorySpool:
+    """Append-only local store of messages not yet committed to PostgreSQL."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS spool ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "message_id TEXT NOT NULL, session_id TEXT, message TEXT NOT NULL)"
+            )
+            # Prompts are kept after replay; there is one row per distinct prompt.
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS prompts (prompt_hash TEXT PRIMARY KEY, content TEXT NOT NULL)"
+            )
+            self._connection.commit()
+
+    def append(self, message_id: str, session_id: str, message: str):
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO spool (message_id, session_id, message) VALUES (?, ?, ?)",
+                (message_id, session_id, message),
+            )
+            self._connection.commit()
+
+    def add_prompt(self, prompt_hash: str, content: str):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO prompts (prompt_hash, content) VALUES (?, ?)", (prompt_hash, content)
+            )
+            self._connection.commit()
+
+    def prompts(self, hashes) -> dict:
+        """Spooled prompt texts for ``hashes``, by hash."""
+        hashes = list(hashes)
+        if not hashes:
+            return {}
+        with self._lock:
+            return dict(self._connection.execute(
+                f"SELECT prompt_hash, content FROM prompts WHERE prompt_hash IN ({', '.join('?' * len(hashes))})",
+                hashes,
+            ).fetchall())
+
+    def session_rows(self, session_id: str) -> list:
+        """Spooled (message_id, message) rows of one session, oldest first."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT message_id, message FROM spool WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+
+    def peek(self, limit: int) -> list:
+        """Oldest spooled rows as (seq, message_id, session_id, message)."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT seq, message_id, session_id, message FROM spool ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+
+    def remove(self, seqs):
+        with self._lock:
+            self._connection.executemany("DELETE FROM spool WHERE seq = ?", [(seq,) for seq in seqs])
+            self._connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+
+class HistoryWriter:
+    """Spool chat messages locally and replay them to PostgreSQL in batches."""
+
+    def __init__(self, connection_string: str, spool_path=None, batch_size=None, flush_interval=None):
+        if batch_size is None:
+            batch_size = int(os.getenv('HISTORY_BATCH_SIZE', '200'))
+        if flush_interval is None:
+            flush_interval = float(os.getenv('HISTORY_FLUSH_INTERVAL', '0.005'))
+        self.connection_string = connection_string
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Also drain periodically, to pick up rows spooled by other processes.
+        self.poll_interval = float(os.getenv('HISTORY_POLL_INTERVAL', '5'))
+        self.spool = HistorySpool(spool_path or default_spool_path())
+        self._table_ready = False
+        self._prompts_spooled = set()
+        self._prompts_written = set()
+        # Called with (session_id, message dict) for every message added.
+        self.listeners = []
+        self._wakeup = threading.Event()
+        self._stopping = False
+
+        # Write statistics.
+        self.healthy = True
+        self.rows_written = 0
+        self.batches_written = 0
+        self.write_errors = 0
+        self.last_write_seconds = 0.0
+        self.max_write_seconds = 0.0
+        self.total_write_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name='engagebot-history', daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.spool)
+
+    def add_message(self, session_id: str, message):
+        """Spool a LangChain message for ``session_id`` and return without touching PostgreSQL."""
+        payload = message_to_dict(message)
+        self.spool.append(str(uuid.uuid4()), session_id, json.dumps(payload))
+        self._wakeup.set()
+        for listener in self.listeners:
+            listener(session_id, payload)
+
+    def add_prompt(self, content: str) -> str:
+        """Spool a system prompt once and return the hash messages reference it by."""
+        key = prompt_hash(content)
+        if key not in self._prompts_spooled:
+            self.spool.add_prompt(key, content)
+            self._prompts_spooled.add(key)
+        return key
+
+    def close(self, timeout=10.0):
+        """Try to flush the spool and stop the writer thread; unsent rows stay spooled."""
+        if self._thread.is_alive():
+            self._stopping = True
+            self._wakeup.set()
+            self._thread.join(timeout)
+
+    def _run(self):
+        delay = 0.0
+        while True:
+            self._wakeup.wait(delay or self.poll_interval)
+            self._wakeup.clear()
+            if self._stopping:
+                self._drain()
+                return
+
+            # Give messages from other sessions a moment to join the batch.
+            time.sleep(self.flush_interval)
+            if self._drain():
+                delay = 0.0
+            else:
+                delay = min(max(delay * 2, 0.5), MAX_RETRY_DELAY)
+
+    def _drain(self) -> bool:
+        """Replay spooled rows until the spool is empty; False if PostgreSQL failed."""
+        while True:
+            rows = self.spool.peek(self.batch_size)
+            if not rows:
+                return True
+            try:
+                self._write(rows)
+            except Exception:
+                self.write_errors += 1
+                if self.healthy:
+                    logger.exception("writing %d history rows failed; keeping them spooled", len(rows))
+                self.healthy = False
+                return False
+            if not self.healthy:
+                logger.warning("history writes recovered")
+            self.healthy = True
+            self.spool.remove([row[0] for row in rows])
+
+    def _write(self, rows):
+        started = time.monotonic()
+        placeholders = '(' + ', '.join(['%s'] * len(COLUMNS)) + ')'
+        values = ', '.join([placeholders] * len(rows))
+        messages = [message_row(message_id, session_id, json.loads(message)) for _, message_id, session_id, message in rows]
+        params = [value for message in messages for value in message]
+        referenced = {message[COLUMNS.index('prompt_hash')] for message in messages}
+        prompts = self.spool.prompts(referenced - self._prompts_written - {None})
+        # The pool commits when the block exits and rolls back on error.
+        with get_pool(self.connection_string).connection() as connection:
+            if not self._table_ready:
+                ensure_schema(connection)
+            if prompts:
+                connection.execute(
+                    f"INSERT INTO {PROMPTS_TABLE} (prompt_hash, content) VALUES "
+                    f"{', '.join(['(%s, %s)'] * len(prompts))} ON CONFLICT (prompt_hash) DO NOTHING",
+                    [value for item in prompts.items() for value in item],
+                )
+            connection.execute(
+                f"INSERT INTO {TABLE_NAME} ({', '.join(COLUMNS)}) VALUES {values} "
+                "ON CONFLICT (message_id) DO NOTHING",
+                params,
+            )
+        self._table_ready = True
+        self._prompts_written.update(prompts)
+
+        elapsed = time.monotonic() - started
+        self.rows_written += len(rows)
+        self.batches_written += 1
+        self.last_write_seconds = elapsed
+        self.max_write_seconds = max(self.max_write_seconds, elapsed)
+        self.total_write_seconds += elapsed
+
+    def render_metrics(self) -> str:
+        """Spool depth and write statistics in the Prometheus text format."""
+        lines = []
+        for name, value, kind, help_text in (
+            ('queue_depth', self.queue_depth, 'gauge', 'Messages spooled locally, not yet in PostgreSQL.'),
+            ('up', self.healthy, 'gauge', 'Whether the latest write to PostgreSQL succeeded.'),
+            ('rows_written_total', self.rows_written, 'counter', 'Messages written.'),
+            ('batches_written_total', self.batches_written, 'counter', 'Multi-row INSERTs executed.'),
+            ('write_errors_total', self.write_errors, 'counter', 'Failed INSERT attempts.'),
+            ('write_seconds_total', self.total_write_seconds, 'counter', 'Time spent writing batches.'),
+            ('last_write_seconds', self.last_write_seconds, 'gauge', 'Duration of the latest batch write.'),
+            ('max_write_seconds', self.max_write_seconds, 'gauge', 'Slowest batch write so far.'),
+        ):
+            metric = f'engagebot_history_{name}'
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} {kind}')
+            lines.append(f'{metric} {float(value):g}')
+        return '\n'.join(lines) + '\n'
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_history_writer(connection_string: str) -> HistoryWriter:
+    """Return the process-wide writer for a database, starting it on first use."""
+    with _writers_lock:
+        writer = _writers.get(connection_string)
+        if writer is None:
+            writer = _writers[connection_string] = HistoryWriter(connection_string)
+            metric_sources.append(writer.render_metrics)
+            start_metrics_server()
+            atexit.register(writer.close)
+        return writer
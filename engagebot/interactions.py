@@ -0,0 +1,155 @@
+"""Interaction definitions served by the Sigma app.
+
+Every interaction used to be its own copy of the page script, differing only
+in its course/week/interaction tags and its system and initial messages.
+They are now TOML files in ``interactions/`` (or ``INTERACTIONS_DIR``), one
+per interaction:
+
+    interactions/nsc396a/2.toml  ->  /?course=nsc396a&interaction=2
+
+rendered by ``engagebot.page``, either all from one process
+(``sigma_app.py``) or one per script as before. The URL number is not always
+the ``interaction`` tag recorded with the messages; see
+``interactions/template_ollama/1.toml`` for the fields.
+
+The directory is parsed once per process and cached. At most every
+``INTERACTIONS_RELOAD_INTERVAL`` seconds a lookup checks file modification
+times and re-parses only the files that changed, so new or edited
+interactions go live without restarting the server. A file that fails to
+parse is logged and its previous version (if any) kept.
+"""
+import logging
+import os
+import threading
+import time
+import tomllib
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'mixtral'
+DEFAULT_TITLE = "Sigma - Learning Mentor"
+
+
+class Interaction:
+    """One chatbot page: what it records messages under and how it prompts the model."""
+
+    def __init__(self, course: str, week: str, interaction: str, system_message: str, initial_message: str,
+                 model=DEFAULT_MODEL, title=DEFAULT_TITLE, persist=True, ttft_deadline=None, fallback_model=None):
+        self.course = course
+        self.week = week
+        self.interaction = interaction
+        self.system_message = system_message
+        self.initial_message = initial_message
+        self.model = model
+        self.title = title
+        # Whether messages are written to PostgreSQL.
+        self.persist = persist
+        # Time-to-first-token deadline in seconds (0 disables it) and the model retried when it is missed;
+        # None uses OLLAMA_TTFT_DEADLINE and OLLAMA_FALLBACK_MODEL.
+        self.ttft_deadline = None if ttft_deadline is None else float(ttft_deadline)
+        self.fallback_model = fallback_model
+
+    @property
+    def tags(self) -> dict:
+        return {'course': self.course, 'week': self.week, 'interaction': self.interaction}
+
+
+def default_directory() -> str:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.getenv('INTERACTIONS_DIR', os.path.join(root, 'interactions'))
+
+
+def load_interaction(path: str, course: str) -> Interaction:
+    with open(path, 'rb') as f:
+        data = tomllib.load(f)
+    # TOML integers are accepted for the tags, which are stored as text.
+    for name in ('week', 'interaction'):
+        data[name] = str(data[name])
+    return Interaction(course=course, **data)
+
+
+class InteractionRegistry:
+    """Parsed interaction files, refreshed from disk when they change."""
+
+    def __init__(self, directory: str, reload_interval=None, clock=time.monotonic):
+        if reload_interval is None:
+            reload_interval = float(os.getenv('INTERACTIONS_RELOAD_INTERVAL', '2'))
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.clock = clock
+        self.reloads = 0
+        # (course, number) -> (mtime, Interaction)
+        self._entries = {}
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def get(self, course: str, number: str):
+        """The interaction served at ``/?course=<course>&interaction=<number>``, or None."""
+        self._refresh()
+        entry = self._entries.get((course, str(number)))
+        return entry[1] if entry else None
+
+    def all(self) -> dict:
+        self._refresh()
+        return {key: interaction for key, (_, interaction) in sorted(self._entries.items()) if interaction}
+
+    def _refresh(self):
+        now = self.clock()
+        if self._checked_at is not None and now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.reload_interval:
+                return
+            self._scan()
+            self._checked_at = now
+
+    def _scan(self):
+        entries = {}
+        for course in sorted(os.listdir(self.directory)):
+            course_dir = os.path.join(self.directory, course)
+            if not os.path.isdir(course_dir):
+                continue
+            for name in sorted(os.listdir(course_dir)):
+                number, extension = os.path.splitext(name)
+                if extension != '.toml':
+                    continue
+                key = (course, number)
+                path = os.path.join(course_dir, name)
+                mtime = os.stat(path).st_mtime_ns
+                previous = self._entries.get(key)
+                if previous is not None and previous[0] == mtime:
+                    entries[key] = previous
+                    continue
+                try:
+                    entries[key] = (mtime, load_interaction(path, course))
+                except Exception:
+                    logger.exception("could not load interaction %s", path)
+                    # Keep serving the previous version; retry once the file changes again.
+                    entries[key] = (mtime, previous[1] if previous else None)
+                    continue
+                if self._checked_at is not None:
+                    logger.info("%s interaction %s/%s", 'reloaded' if previous else 'added', *key)
+        for key in self._entries.keys() - entries.keys():
+            logger.info("removed interaction %s/%s", *key)
+        if entries != self._entries:
+            self.reloads += 1
+        # Replaced in one assignment, so lookups never see a partial scan.
+        self._entries = entries
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> InteractionRegistry:
+    """Return the process-wide registry of ``default_directory()``."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = InteractionRegistry(default_directory())
+        return _registry
+
+
+def get_interaction(course: str, number: str):
+    """The interaction served at ``/?course=<course>&interaction=<number>``, or None."""
+    return get_registry().get(course, number)
@@ -0,0 +1,83 @@
+"""Backfill ``chat_messages`` from LangChain's ``message_store`` table.
+
+    python -m engagebot.migrate [--batch-size 5000]
+
+Copies rows in primary-key order, one batch per transaction, extracting
+course, week, interaction, role, content and timestamp from the JSON
+``message`` column inside PostgreSQL. Each copied row keeps its
+``message_store`` id in ``legacy_id``, so the command can be interrupted and
+re-run: rows already copied are skipped. The source table is left untouched.
+"""
+import argparse
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from engagebot.db import default_connection_string, get_pool
+from engagebot.schema import TABLE_NAME, ensure_schema
+
+SOURCE_TABLE = 'message_store'
+
+# One batch: the next rows of message_store after the last id copied.
+BACKFILL = f"""
+    WITH batch AS (
+        SELECT id, session_id, message FROM {SOURCE_TABLE}
+        WHERE id > %(after)s ORDER BY id LIMIT %(limit)s
+    ), copied AS (
+        INSERT INTO {TABLE_NAME} (legacy_id, session_id, course, week, interaction, role, content, ts)
+        SELECT
+            id,
+            session_id,
+            message->'data'->'additional_kwargs'->>'course',
+            message->'data'->'additional_kwargs'->>'week',
+            message->'data'->'additional_kwargs'->>'interaction',
+            CASE message->>'type' WHEN 'human' THEN 'user' WHEN 'ai' THEN 'assistant' ELSE message->>'type' END,
+            COALESCE(message->'data'->>'content', ''),
+            (message->'data'->'additional_kwargs'->>'timestamp')::timestamp
+        FROM batch
+        ON CONFLICT (legacy_id) DO NOTHING
+        RETURNING 1
+    )
+    SELECT (SELECT max(id) FROM batch), (SELECT count(*) FROM batch), (SELECT count(*) FROM copied)
+"""
+
+
+def backfill(connection_string: str, batch_size: int) -> int:
+    """Copy every ``message_store`` row not yet in ``chat_messages``; returns rows copied."""
+    pool = get_pool(connection_string)
+    with pool.connection() as connection:
+        ensure_schema(connection)
+        if connection.execute("SELECT to_regclass(%s)", (SOURCE_TABLE,)).fetchone()[0] is None:
+            print(f"no {SOURCE_TABLE} table; nothing to backfill")
+            return 0
+        # Resume after the last legacy row copied by an earlier run.
+        after = connection.execute(f"SELECT COALESCE(max(legacy_id), 0) FROM {TABLE_NAME}").fetchone()[0]
+
+    total = 0
+    started = time.monotonic()
+    while True:
+        with pool.connection() as connection:
+            last_id, scanned, copied = connection.execute(
+                BACKFILL, {'after': after, 'limit': batch_size}
+            ).fetchone()
+        if not scanned:
+            break
+        after = last_id
+        total += copied
+        print(f"copied {total} rows (up to {SOURCE_TABLE}.id {after}, {time.monotonic() - started:.1f}s)", flush=True)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill chat_messages from message_store.")
+    parser.add_argument('--batch-size', type=int, default=5000, help="rows copied per transaction")
+    args = parser.parse_args()
+
+    load_dotenv()
+    total = backfill(default_connection_string(), args.batch_size)
+    print(f"done: {total} rows copied into {TABLE_NAME}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""The Sigma chat page, rendered for any interaction definition.
+
+This is the page every ``<course>_interactionN.py`` script used to contain,
+parameterised by an ``engagebot.interactions.Interaction``. Call
+``render_interaction`` once per Streamlit run; shared resources (inference
+gateway, history writer, connection pools) are process-wide singletons, so
+any number of interactions can be served by one process.
+
+The conversation is also kept in the shared session state backend
+(``engagebot.state``), keyed by the student's hashed id or a random id in a
+cookie (never in the URL, where a copied link would share the conversation),
+so it survives a reconnect to another worker or a worker restart.
+
+The history layer (``engagebot.history`` and LangChain's message classes) is
+imported the first time an interaction that persists its messages is
+rendered, so interactions with ``persist = false`` never load it; see
+``bench/bench_imports.py`` for the import cost of a cold worker.
+
+The chat input and the exchanges sent from it run in a fragment
+(``st.fragment``): submitting a message reruns only the fragment instead of
+the whole page. The page header, the CSS (read once per process) and the
+messages present at the last full run (when the page was opened or
+reloaded) are drawn by full runs only; the fragment keeps the input pinned
+to the bottom of the page (``st.bottom``) and draws the new exchange, so a
+turn does not re-render the conversation the student came back to.
+
+A fragment rerun clears what the fragment drew before, though, so each turn
+also redraws every exchange sent since the last full run: the work of a turn
+is O(turns since the page was loaded), not constant. ``bench/bench_render.py``
+measures it (about 0.4 ms per message drawn; some 75 ms after 100 turns).
+"""
+import os
+import re
+import uuid
+from datetime import datetime
+from functools import lru_cache
+
+import streamlit as st
+
+from engagebot.context import fit_messages
+from engagebot.db import default_connection_string
+from engagebot.gateway import GatewayBusy, chat_stream
+from engagebot.resume import LAUNCH_PARAMS, conversation_session_id, get_conversation_store, student_from_query
+from engagebot.schema import prompt_hash
+from engagebot.state import SESSION_COOKIE, get_state_backend
+from engagebot.streaming import BUSY_MESSAGE, render_stream, show_queue_position
+
+_SESSION_KEY = re.compile(r'[0-9a-f]{32}')
+
+STYLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'style.css')
+
+
+# Function to read CSS file and return its content (once per process)
+@lru_cache(maxsize=None)
+def load_css(css_file):
+    with open(css_file, "r") as f:
+        return f.read()
+
+
+class ChatHistory:
+    """Where one session's messages are recorded; a no-op when persistence is off."""
+
+    def __init__(self, definition, session_id: str, connection_string=None):
+        self.definition = definition
+        self.session_id = session_id
+        self.connection_string = connection_string
+        self.writer = None
+        if connection_string:
+            from engagebot.history import get_history_writer
+
+            # Messages are written in batches by a process-wide background writer.
+            self.writer = get_history_writer(connection_string)
+
+    def _kwargs(self, timestamp=None) -> dict:
+        return {
+            'timestamp': (timestamp or datetime.now()).isoformat(),
+            **self.definition.tags,
+            'prompt_hash': prompt_hash(self.definition.system_message),
+        }
+
+    def add_human(self, message: str, timestamp=None):
+        if self.writer:
+            from langchain_core.messages.human import HumanMessage
+
+            self.writer.add_message(
+                self.session_id, HumanMessage(content=message, additional_kwargs=self._kwargs(timestamp))
+            )
+
+    def add_ai(self, message: str):
+        if self.writer:
+            from langchain_core.messages.ai import AIMessage
+
+            self.writer.add_message(self.session_id, AIMessage(content=message, additional_kwargs=self._kwargs()))
+
+    def add_prompt(self, message: str):
+        if self.writer:
+            self.writer.add_prompt(message)
+
+    def load(self, student) -> list:
+        """Earlier messages of a resumed conversation, read once per process and cached."""
+        if student and self.writer:
+            return get_conversation_store(self.connection_string).load(self.session_id)
+        return []
+
+
+def browser_key() -> str:
+    """Random id of this browser's conversations, from the cookie nginx sets.
+
+    Without the cookie (e.g. ``streamlit run`` without nginx) the id lasts as
+    long as the Streamlit session.
+    """
+    key = str(st.context.cookies.get(SESSION_COOKIE) or '')
+    if not _SESSION_KEY.fullmatch(key):
+        key = st.session_state.setdefault("browser_key", uuid.uuid4().hex)
+    return key
+
+
+def save_state(key: str):
+    """Write the messages added during this run to the session state backend, in one call."""
+    messages = st.session_state["messages"][1:] # The system prompt comes from the definition
+    persisted = st.session_state.get("persisted", 0)
+    if len(messages) > persisted:
+        get_state_backend().append(key, messages, persisted)
+        st.session_state["persisted"] = len(messages)
+
+
+def model_res_generator(definition, session_id: str):
+    """Stream the answer to the conversation so far; None if the gateway shed the turn."""
+    # Container to hold the LLM response
+    container = st.empty()
+
+    stream = chat_stream(
+        model=definition.model,
+        # Keep the prompt within the token budget (system prompt and questions always kept)
+        messages=fit_messages(st.session_state["messages"]),
+        session_id=session_id,
+        tags=definition.tags,
+        # Per-interaction time-to-first-token deadline; None falls back to the .env defaults
+        ttft_deadline=definition.ttft_deadline,
+        fallback_model=definition.fallback_model,
+        # Show the student's place in line while the backend is at capacity
+        on_queued=lambda position: show_queue_position(container, position),
+    )
+
+    try:
+        # Stream the response into the container, coalescing tokens into bounded-rate updates.
+        return render_stream(stream, container)
+    except GatewayBusy:
+        container.warning(BUSY_MESSAGE)
+        return None
+
+
+def render_page_header(title: str):
+    st.set_page_config(page_title=title, page_icon=":robot:")
+
+    # Load CSS styling
+    css_content = load_css(STYLE_PATH)
+    st.markdown(f'<style>{css_content}</style>', unsafe_allow_html=True)
+
+
+def render_interaction(definition):
+    """Render the chat page for ``definition`` (an ``Interaction``)."""
+    # Students launched from the LMS resume their conversation; otherwise an id in the URL keeps it across reconnects.
+    if student := student_from_query(st.query_params):
+        st.session_state["student"] = student
+    # The launch link is single-use: keep it out of the address bar, where it could be copied.
+    # ``session`` held the conversation id in older links.
+    for name in (*LAUNCH_PARAMS, 'session'):
+        if name in st.query_params:
+            del st.query_params[name]
+    student = st.session_state.get("student")
+    session_id = conversation_session_id(
+        student or browser_key(), definition.course, definition.week, definition.interaction
+    )
+    history = ChatHistory(definition, session_id, default_connection_string() if definition.persist else None)
+
+    render_page_header(definition.title)
+    st.title(definition.title)
+
+    # initialize history (again if this browser session switched to another interaction)
+    if st.session_state.get("interaction") != definition.tags:
+        st.session_state["interaction"] = definition.tags
+        st.session_state["messages"] = []
+
+        # Add system message (stored once in PostgreSQL and referenced by hash)
+        st.session_state.messages.append({"role":"system", "content": definition.system_message})
+        history.add_prompt(definition.system_message)
+
+        # Pick up a conversation another worker was serving, or resume an earlier one, without calling the model again
+        shared_messages = get_state_backend().load(session_id)
+        st.session_state["persisted"] = len(shared_messages)
+        previous_messages = shared_messages or history.load(student)
+        if previous_messages:
+            st.session_state.messages.extend(previous_messages)
+        else:
+            # Add initial message
+            st.session_state.messages.append({"role":"assistant", "content": definition.initial_message})
+
+            # Add the message to PostgreSQL
+            history.add_ai(definition.initial_message)
+        save_state(session_id)
+
+    # Display chat messages from history on full runs; the fragment draws the ones added after this
+    render_messages(st.session_state["messages"][1:]) # Start from the second message to exclude the system prompt
+    st.session_state["rendered"] = len(st.session_state["messages"])
+
+    render_chat(definition, session_id, history)
+
+
+def render_messages(messages):
+    for message in messages:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"], unsafe_allow_html=True)
+
+
+@st.fragment
+def render_chat(definition, session_id: str, history: ChatHistory):
+    """The chat input and the exchanges sent from it, rerun on their own when a message is submitted."""
+    # A fragment rerun clears what it drew before: redraw the exchanges since the last full run.
+    render_messages(st.session_state["messages"][st.session_state["rendered"]:])
+
+    with st.bottom:
+        prompt = st.chat_input("What is up?")
+    if prompt:
+        sent_at = datetime.now()
+        # add latest message to history in format {role, content}
+        st.session_state["messages"].append({"role": "user", "content": prompt})
+
+        with st.chat_message("user"):
+            st.markdown(prompt, unsafe_allow_html=True)
+
+        with st.chat_message("assistant"):
+            message = model_res_generator(definition, session_id)
+
+        if message is None:
+            # The turn was shed and the student is asked to send it again: forget it, so it is not recorded twice.
+            st.session_state["messages"].pop()
+            return
+
+        # Store the prompt in PostgreSQL now that it was answered, with the time it was sent
+        history.add_human(prompt, sent_at)
+        if message:
+            # Append the full message to the chat history
+            st.session_state["messages"].append({"role": "assistant", "content": message})
+
+            # Store the message in PostgreSQL
+            history.add_ai(message)
+        save_state(session_id)
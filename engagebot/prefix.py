@@ -0,0 +1,39 @@
+"""Prompt-prefix reuse.
+
+The system prompt and initial question list are identical for every student
+and every turn of an interaction. Ollama can skip re-evaluating a prompt
+prefix it already holds in its KV cache, as long as the model stays loaded
+and the prefix is byte-identical and first in the prompt. This module
+provides the request options that keep the model resident and pin the
+static head of the conversation. Whether the prefix is reused can be
+checked per interaction in ``engagebot.telemetry``'s metrics, by comparing
+``engagebot_prompt_eval_tokens_total`` (tokens Ollama evaluated) with
+``engagebot_prompt_tokens_total`` (tokens sent).
+"""
+import os
+
+from engagebot.context import HEAD_MESSAGES, message_tokens
+
+
+def keep_alive():
+    """How long Ollama keeps a model loaded after a request (``OLLAMA_KEEP_ALIVE``, default forever).
+
+    Every request resets the model's expiry to its own keep-alive, so chat
+    requests and ``engagebot.warmup`` use this same value; otherwise the first
+    turn would replace the warm-up's pin and the model would unload again
+    after a quiet period.
+    """
+    value = os.getenv('OLLAMA_KEEP_ALIVE', '-1')
+    # Ollama accepts durations like "30m" as well as a number of seconds (negative: never unload).
+    return int(value) if value.lstrip('-').isdigit() else value
+
+
+def prefix_options(messages, head=HEAD_MESSAGES) -> dict:
+    """Extra chat() arguments that keep the model loaded and pin the static prefix."""
+    # num_keep tells Ollama how many prompt tokens to preserve when it has to
+    # shift the context window, so the system prompt is never shifted out.
+    num_keep = sum(message_tokens(message) for message in messages[:head])
+    return {
+        'keep_alive': keep_alive(),
+        'options': {'num_keep': num_keep},
+    }
@@ -0,0 +1,196 @@
+"""Resume a student's conversation each time they open an interaction.
+
+The Streamlit session id changes on every refresh, so keying chat history by
+it starts a new conversation each time and orphans the old one. Students who
+arrive through the LMS (LTI) launch are instead identified by a pseudonymous
+hash of their LTI user id, and their conversation id is derived from that hash
+and the interaction, so every launch of the same interaction continues the
+same conversation.
+
+The launch handler redirects to the interaction with ``launch_params(user_id)``
+in the query string: the student id, the time the link was issued, and an
+HMAC of both under ``STUDENT_ID_SECRET``, so raw LMS ids never reach the
+database and a student id cannot be forged in the URL. A link is only
+accepted for ``RESUME_LINK_MAX_AGE`` seconds after it was issued, and the
+page removes the parameters from the address bar once it has verified them,
+so a copied, bookmarked or screenshotted link does not open the student's
+conversation later; each LMS launch issues a fresh one. Without the secret
+(or without valid parameters) the page falls back to a per-browser
+conversation id (see ``engagebot.page``).
+
+On load, the earlier messages are read once per process from
+``chat_messages`` (via the ``(session_id, ts)`` index) plus anything still in
+the local history spool, and kept in an LRU cache that the history writer
+keeps up to date, so ``st.session_state["messages"]`` can be rehydrated
+without asking the model again.
+
+The read waits at most ``RESUME_DB_TIMEOUT`` seconds for PostgreSQL. If it
+fails, the page goes on with what is still in the spool (or a new
+conversation), the result is not cached, and PostgreSQL is not asked again
+for ``RESUME_RETRY_INTERVAL`` seconds, so an outage never holds up a page.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from engagebot.db import get_pool
+from engagebot.schema import ROLES, TABLE_NAME
+
+logger = logging.getLogger(__name__)
+
+
+def _secret() -> bytes:
+    return os.getenv('STUDENT_ID_SECRET', '').encode('utf-8')
+
+
+def _sign(kind: str, value: str) -> str:
+    return hmac.new(_secret(), f'{kind}:{value}'.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+# Query parameters of a launch link, removed from the address bar once verified.
+LAUNCH_PARAMS = ('student', 'iat', 'sig')
+
+# Seconds a launch link may be issued in the future (clock skew between hosts).
+CLOCK_SKEW = 60
+
+
+def launch_params(user_id: str, issued_at=None) -> dict:
+    """Query parameters identifying an LTI user (the ``sub`` claim) to the interaction scripts."""
+    if not _secret():
+        raise RuntimeError("STUDENT_ID_SECRET is not set")
+    student = _sign('student', user_id)
+    issued_at = str(int(time.time() if issued_at is None else issued_at))
+    return {'student': student, 'iat': issued_at, 'sig': _sign('sig', f'{student}:{issued_at}')}
+
+
+def student_from_query(params, max_age=None, now=None) -> str:
+    """The hashed student id from verified, unexpired launch parameters, or None."""
+    student, issued_at, signature = (params.get(name) for name in LAUNCH_PARAMS)
+    if not (_secret() and student and issued_at and signature):
+        return None
+    if not hmac.compare_digest(_sign('sig', f'{student}:{issued_at}'), signature):
+        return None
+    if max_age is None:
+        max_age = float(os.getenv('RESUME_LINK_MAX_AGE', '300'))
+    age = (time.time() if now is None else now) - int(issued_at)
+    if not -CLOCK_SKEW <= age <= max_age:
+        return None
+    return student
+
+
+def conversation_session_id(student: str, course: str, week: str, interaction: str) -> str:
+    return f'{student}:{course}:{week}:{interaction}'
+
+
+def _chat_message(payload: dict) -> dict:
+    """``{"role", "content"}`` from a LangChain ``message_to_dict`` payload."""
+    return {'role': ROLES.get(payload['type'], payload['type']), 'content': payload['data']['content']}
+
+
+class ConversationStore:
+    """LRU cache of resumed conversations, filled from PostgreSQL and the history spool."""
+
+    def __init__(self, connection_string: str, max_sessions=None, timeout=None, retry_interval=None,
+                 clock=time.monotonic):
+        if max_sessions is None:
+            max_sessions = int(os.getenv('RESUME_CACHE_SIZE', '512'))
+        if timeout is None:
+            timeout = float(os.getenv('RESUME_DB_TIMEOUT', '2'))
+        if retry_interval is None:
+            retry_interval = float(os.getenv('RESUME_RETRY_INTERVAL', '30'))
+        self.connection_string = connection_string
+        self.max_sessions = max_sessions
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.clock = clock
+        self.failures = 0
+        # PostgreSQL is skipped until then after a failed read.
+        self._down_until = None
+        # Imported here so pages that do not persist never load the history layer (and LangChain).
+        from engagebot.history import get_history_writer
+
+        self.writer = get_history_writer(connection_string)
+        self.hits = 0
+        self.misses = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.writer.listeners.append(self.append)
+
+    def load(self, session_id: str) -> list:
+        """Earlier messages of a conversation, oldest first, without the system prompt."""
+        with self._lock:
+            messages = self._sessions.get(session_id)
+            if messages is not None:
+                self._sessions.move_to_end(session_id)
+                self.hits += 1
+                return list(messages)
+            self.misses += 1
+
+        messages = self._fetch(session_id)
+        if messages is None:
+            # PostgreSQL is unavailable: go on with the spooled messages, and read it again next time.
+            return self._spooled(session_id, set())
+        with self._lock:
+            # Another rerun may have loaded the same conversation meanwhile.
+            if session_id not in self._sessions:
+                self._store(session_id, messages)
+            return list(self._sessions[session_id])
+
+    def append(self, session_id: str, payload: dict):
+        """History writer listener: extend a cached conversation with a new message."""
+        with self._lock:
+            messages = self._sessions.get(session_id)
+            if messages is not None:
+                messages.append(_chat_message(payload))
+
+    def _store(self, session_id: str, messages: list):
+        self._sessions[session_id] = messages
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def _fetch(self, session_id: str):
+        """The whole conversation, or None if PostgreSQL could not be read in time."""
+        if self._down_until is not None and self.clock() < self._down_until:
+            return None
+        try:
+            with get_pool(self.connection_string).connection(timeout=self.timeout) as connection:
+                connection.execute(f"SET LOCAL statement_timeout = {int(self.timeout * 1000)}")
+                rows = connection.execute(
+                    f"SELECT message_id, role, content FROM {TABLE_NAME} "
+                    "WHERE session_id = %s AND role <> 'system' ORDER BY ts, id",
+                    (session_id,),
+                ).fetchall()
+        except Exception as e:
+            self.failures += 1
+            self._down_until = self.clock() + self.retry_interval
+            logger.warning("could not read conversation %s from PostgreSQL (%s); using the spool", session_id, e)
+            return None
+        self._down_until = None
+        messages = [{'role': role, 'content': content} for _, role, content in rows]
+        # Messages not yet replayed to PostgreSQL are still in the local spool.
+        return messages + self._spooled(session_id, {str(message_id) for message_id, _, _ in rows})
+
+    def _spooled(self, session_id: str, written: set) -> list:
+        return [
+            _chat_message(json.loads(message))
+            for message_id, message in self.writer.spool.session_rows(session_id)
+            if message_id not in written
+        ]
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_conversation_store(connection_string: str) -> ConversationStore:
+    """Return the process-wide conversation cache for a database."""
+    with _stores_lock:
+        store = _stores.get(connection_string)
+        if store is None:
+            store = _stores[connection_string] = ConversationStore(connection_string)
+        return store
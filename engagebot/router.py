@@ -0,0 +1,69 @@
+"""Spread chat requests over several Ollama hosts.
+
+The hosts are listed in ``OLLAMA_HOSTS`` (comma separated), so a host can be
+added, drained or replaced by editing ``.env`` instead of every interaction
+script. Each request goes to the healthy host with the fewest outstanding
+(in-flight plus queued) requests. Hosts are health-checked in the background,
+and a host that refuses a connection is taken out of rotation until a check
+succeeds again.
+
+All methods run on the gateway's event loop thread.
+"""
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = 'http://localhost:11434'
+
+
+def configured_hosts() -> list:
+    hosts = os.getenv('OLLAMA_HOSTS', DEFAULT_HOST)
+    return [host.strip().rstrip('/') for host in hosts.split(',') if host.strip()]
+
+
+class BackendRouter:
+    """Least-outstanding-requests choice among healthy backends."""
+
+    def __init__(self, backends, check_interval=None, check_timeout=5.0):
+        if check_interval is None:
+            check_interval = float(os.getenv('OLLAMA_HEALTH_INTERVAL', '10'))
+        self.backends = list(backends)
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self._checker = None
+
+    def pick(self, exclude=()):
+        """Backend for the next request, or None if every candidate is excluded."""
+        candidates = [backend for backend in self.backends if backend not in exclude]
+        healthy = [backend for backend in candidates if backend.healthy]
+        # With nothing healthy, keep trying the known hosts rather than failing outright.
+        candidates = healthy or candidates
+        if not candidates:
+            return None
+        return min(candidates, key=lambda backend: (backend.in_flight + backend.queued, backend.in_flight))
+
+    def mark_down(self, backend, error):
+        if backend.healthy:
+            logger.warning("ollama host %s marked down: %s", backend.host, error)
+        backend.healthy = False
+
+    def start(self, loop):
+        if self._checker is None and self.check_interval > 0:
+            self._checker = loop.create_task(self._check_forever())
+
+    async def _check_forever(self):
+        while True:
+            await asyncio.gather(*(self._check(backend) for backend in self.backends))
+            await asyncio.sleep(self.check_interval)
+
+    async def _check(self, backend):
+        try:
+            await asyncio.wait_for(backend.client.ps(), self.check_timeout)
+        except Exception as e:
+            self.mark_down(backend, e)
+            return
+        if not backend.healthy:
+            logger.warning("ollama host %s is back up", backend.host)
+        backend.healthy = True
@@ -0,0 +1,82 @@
+"""Chat message table with typed, indexed columns.
+
+LangChain's ``message_store`` keeps course, week and interaction inside the
+JSON ``message`` column, so every per-course query scans and parses the whole
+table. ``chat_messages`` stores them as plain columns with indexes for the
+common access paths (one course/week/interaction over time, one session in
+order). The history writer fills it directly; ``python -m engagebot.migrate``
+backfills rows written to ``message_store`` before it existed.
+
+System prompts are stored once in ``system_prompts``, keyed by the SHA-256 of
+their text, instead of as a message at the start of every session. Messages
+carry the ``prompt_hash`` of the prompt their session ran under.
+"""
+import hashlib
+from datetime import datetime
+from functools import lru_cache
+
+TABLE_NAME = 'chat_messages'
+PROMPTS_TABLE = 'system_prompts'
+
+# LangChain message types -> chat roles.
+ROLES = {'human': 'user', 'ai': 'assistant', 'system': 'system'}
+
+DDL = (
+    f"""CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+        id BIGSERIAL PRIMARY KEY,
+        message_id UUID UNIQUE,
+        legacy_id INTEGER UNIQUE,
+        session_id TEXT,
+        course TEXT,
+        week TEXT,
+        interaction TEXT,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        ts TIMESTAMP
+    )""",
+    f"CREATE INDEX IF NOT EXISTS {TABLE_NAME}_course_idx ON {TABLE_NAME} (course, week, interaction, ts)",
+    f"CREATE INDEX IF NOT EXISTS {TABLE_NAME}_session_idx ON {TABLE_NAME} (session_id, ts)",
+    f"""CREATE TABLE IF NOT EXISTS {PROMPTS_TABLE} (
+        prompt_hash TEXT PRIMARY KEY,
+        content TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT now()
+    )""",
+    # Not a foreign key: a message may reach PostgreSQL before its prompt does.
+    f"ALTER TABLE {TABLE_NAME} ADD COLUMN IF NOT EXISTS prompt_hash TEXT",
+    f"CREATE INDEX IF NOT EXISTS {TABLE_NAME}_prompt_idx ON {TABLE_NAME} (prompt_hash)",
+    # When the row was written (its transaction's start), for incremental exports; ids are handed out at
+    # INSERT time, so a batch committed late by one process can sit below ids another process already committed.
+    f"ALTER TABLE {TABLE_NAME} ADD COLUMN IF NOT EXISTS inserted_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+    f"CREATE INDEX IF NOT EXISTS {TABLE_NAME}_inserted_idx ON {TABLE_NAME} (inserted_at)",
+)
+
+COLUMNS = ('message_id', 'session_id', 'course', 'week', 'interaction', 'role', 'content', 'ts', 'prompt_hash')
+
+
+def ensure_schema(connection):
+    for statement in DDL:
+        connection.execute(statement)
+
+
+@lru_cache(maxsize=64)
+def prompt_hash(content: str) -> str:
+    """Registry key of a system prompt: the SHA-256 of its text."""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def message_row(message_id: str, session_id: str, message: dict) -> tuple:
+    """Column values (in ``COLUMNS`` order) for a LangChain ``message_to_dict`` payload."""
+    data = message['data']
+    kwargs = data.get('additional_kwargs') or {}
+    timestamp = kwargs.get('timestamp')
+    return (
+        message_id,
+        session_id,
+        kwargs.get('course'),
+        kwargs.get('week'),
+        kwargs.get('interaction'),
+        ROLES.get(message['type'], message['type']),
+        data['content'],
+        datetime.fromisoformat(timestamp) if timestamp else datetime.now(),
+        kwargs.get('prompt_hash'),
+    )
@@ -0,0 +1,173 @@
+"""Conversation state shared by all Streamlit workers.
+
+``st.session_state`` lives in one worker process: a second worker behind
+nginx, or the same worker after a restart, starts the conversation over. The
+page therefore also writes each conversation to a backend chosen by
+``SESSION_STATE_URL``:
+
+- ``sqlite:///.spool/sessions.sqlite`` (default): a local SQLite file in WAL
+  mode, shared by all workers on the host,
+- ``redis://host:6379/0``: any Redis-compatible server, for workers spread
+  over several hosts (needs the ``redis`` package),
+- ``memory``: a per-process dict, for development and tests.
+
+Conversations are keyed by a random id kept in the browser's
+``sigma_session`` cookie, which nginx sets when it is missing (or the resumed
+conversation id of an LMS student), so a browser that reconnects to another
+worker finds its conversation again. The page reads a conversation only when
+a Streamlit session starts, and writes only the messages added during a
+script run, in one call; reruns without new messages do not touch the
+backend. Conversations expire after ``SESSION_STATE_TTL`` seconds without a
+write; if the stored copy has expired (e.g. a tab left open for longer)
+when new messages arrive, the whole conversation is written again.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Seconds between sweeps of expired conversations in SQLite.
+PRUNE_INTERVAL = 3600
+# Cookie holding a browser's random conversation id; set by the generated nginx config.
+SESSION_COOKIE = 'sigma_session'
+
+
+class MemoryBackend:
+    """Conversations in a dict of this process; for development and tests."""
+
+    def __init__(self, ttl: float, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def load(self, key: str) -> list:
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None or entry[0] < self.clock():
+                return []
+            return list(entry[1])
+
+    def append(self, key: str, messages: list, start: int):
+        """Store the conversation ``messages``, of which the first ``start`` were stored before."""
+        with self._lock:
+            self._sessions[key] = (self.clock() + self.ttl, list(messages))
+
+
+class SqliteBackend:
+    """Conversations in a local SQLite file shared by the workers of one host."""
+
+    def __init__(self, path: str, ttl: float):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS session_messages ("
+                "key TEXT NOT NULL, seq INTEGER NOT NULL, message TEXT NOT NULL, updated REAL NOT NULL, "
+                "PRIMARY KEY (key, seq))"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS session_messages_updated_idx ON session_messages (updated)"
+            )
+            self._connection.commit()
+
+    def load(self, key: str) -> list:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT message FROM session_messages WHERE key = ? AND updated >= ? ORDER BY seq",
+                (key, time.time() - self.ttl),
+            ).fetchall()
+        return [json.loads(message) for message, in rows]
+
+    def append(self, key: str, messages: list, start: int):
+        """Store the conversation ``messages``, of which the first ``start`` were stored before."""
+        now = time.time()
+        with self._lock:
+            with self._connection:
+                stored, = self._connection.execute(
+                    "SELECT COUNT(*) FROM session_messages WHERE key = ? AND seq < ? AND updated >= ?",
+                    (key, start, now - self.ttl),
+                ).fetchone()
+                if stored < start:
+                    # The stored copy expired (or was pruned): write the whole conversation again.
+                    start = 0
+                self._connection.execute("DELETE FROM session_messages WHERE key = ? AND seq >= ?", (key, start))
+                self._connection.executemany(
+                    "INSERT INTO session_messages (key, seq, message, updated) VALUES (?, ?, ?, ?)",
+                    [(key, seq, json.dumps(messages[seq]), now) for seq in range(start, len(messages))],
+                )
+                # Keep the whole conversation alive, not just its latest messages.
+                self._connection.execute("UPDATE session_messages SET updated = ? WHERE key = ?", (now, key))
+            if now - self._pruned_at > PRUNE_INTERVAL:
+                self._pruned_at = now
+                with self._connection:
+                    self._connection.execute("DELETE FROM session_messages WHERE updated < ?", (now - self.ttl,))
+
+
+class RedisBackend:
+    """Conversations as Redis lists, for workers on several hosts."""
+
+    def __init__(self, url: str, ttl: float):
+        import redis
+
+        self.ttl = ttl
+        self._redis = redis.Redis.from_url(url)
+
+    @staticmethod
+    def _key(key: str) -> str:
+        return f'engagebot:session:{key}'
+
+    def load(self, key: str) -> list:
+        return [json.loads(message) for message in self._redis.lrange(self._key(key), 0, -1)]
+
+    def append(self, key: str, messages: list, start: int):
+        """Store the conversation ``messages``, of which the first ``start`` were stored before."""
+        name = self._key(key)
+        if start and self._redis.llen(name) < start:
+            # The stored copy expired: write the whole conversation again.
+            start = 0
+        with self._redis.pipeline(transaction=True) as pipe:
+            # Drop anything past ``start`` (e.g. written by a worker that was cut off).
+            if start:
+                pipe.ltrim(name, 0, start - 1)
+            else:
+                pipe.delete(name)
+            if len(messages) > start:
+                pipe.rpush(name, *[json.dumps(message) for message in messages[start:]])
+            pipe.expire(name, int(self.ttl))
+            pipe.execute()
+
+
+def make_backend(url: str, ttl: float):
+    if url == 'memory':
+        return MemoryBackend(ttl)
+    if url.startswith('sqlite:///'):
+        return SqliteBackend(url[len('sqlite:///'):], ttl)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url, ttl)
+    raise ValueError(f"unsupported SESSION_STATE_URL: {url}")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_state_backend():
+    """Return the process-wide session state backend configured by ``SESSION_STATE_URL``."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = make_backend(
+                os.getenv('SESSION_STATE_URL', 'sqlite:///' + os.path.join('.spool', 'sessions.sqlite')),
+                float(os.getenv('SESSION_STATE_TTL', str(7 * 24 * 3600))),
+            )
+        return _backend
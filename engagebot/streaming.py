@@ -0,0 +1,95 @@
+"""Render a streamed Ollama response into a Streamlit placeholder.
+
+Writing the whole growing message to the placeholder on every token sends one
+full delta per token to the browser and rebuilds the string each time. The
+renderer here buffers chunks and only pushes an update when enough time has
+passed or enough text has accumulated since the previous update.
+"""
+import time
+
+# Markup shown in the placeholder until the first token arrives.
+TYPING_ANIMATION = '<div class="typing-animation"></div>'
+
+# Shown instead of a response when the inference gateway sheds the request.
+BUSY_MESSAGE = "Sigma is helping a lot of students right now. Please wait a minute and send your message again."
+
+# Default flush thresholds: at most ~10 updates per second, or sooner when a
+# large burst of text arrives.
+FLUSH_INTERVAL = 0.1
+FLUSH_CHARS = 256
+
+
+class CoalescingRenderer:
+    """Accumulate streamed text and flush it to a placeholder at a bounded rate."""
+
+    def __init__(self, container, flush_interval=FLUSH_INTERVAL, flush_chars=FLUSH_CHARS, clock=time.monotonic):
+        self.container = container
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+        self.clock = clock
+
+        # Chunks received since the last flush, and the text already flushed.
+        self._pending = []
+        self._pending_chars = 0
+        self._text = ""
+        self._last_flush = None
+
+        # Number of updates pushed to the container.
+        self.flushes = 0
+
+    @property
+    def text(self) -> str:
+        if self._pending:
+            self._text += "".join(self._pending)
+            self._pending = []
+            self._pending_chars = 0
+        return self._text
+
+    def write(self, chunk: str):
+        if not chunk:
+            return
+        self._pending.append(chunk)
+        self._pending_chars += len(chunk)
+
+        # Flush right away on the first chunk so time-to-first-token is unchanged.
+        now = self.clock()
+        if (self._last_flush is None
+                or self._pending_chars >= self.flush_chars
+                or now - self._last_flush >= self.flush_interval):
+            self.flush(now)
+
+    def flush(self, now=None):
+        if not self._pending:
+            return
+        self.container.write(self.text)
+        self._last_flush = self.clock() if now is None else now
+        self.flushes += 1
+
+
+def show_queue_position(container, position: int):
+    """Replace the typing animation with the student's place in line (0: back to the animation)."""
+    if position == 0:
+        # The request has a slot now; the answer is on its way.
+        container.markdown(TYPING_ANIMATION, unsafe_allow_html=True)
+        return
+    container.markdown(
+        f'<div class="queue-position">Sigma is busy with other students. You are number {position} in line.</div>'
+        + TYPING_ANIMATION,
+        unsafe_allow_html=True,
+    )
+
+
+def render_stream(stream, container, **kwargs) -> str:
+    """Show the typing animation, stream chunks into the container and return the full message."""
+    # Initially display the type animation until first token is received.
+    container.markdown(TYPING_ANIMATION, unsafe_allow_html=True)
+
+    renderer = CoalescingRenderer(container, **kwargs)
+    for chunk in stream:
+        renderer.write(chunk["message"]["content"])
+
+    # Push whatever is still buffered once the stream ends.
+    renderer.flush()
+    if not renderer.flushes:
+        container.empty()
+    return renderer.text
@@ -0,0 +1,380 @@
+"""Run and watch the Streamlit workers, and generate their nginx config.
+
+    python -m engagebot.supervisor [--config supervisor.toml] [--nginx-conf PATH]
+
+Workers run ``sigma_app.py`` in pools described by ``supervisor.toml``:
+
+    base_port = 8501
+    workers = 2                 # the default pool, serving every interaction
+
+    [[pools]]                   # a busy interaction with workers of its own
+    course = 'nsc396a'
+    interaction = '2'
+    workers = 3
+
+Each extra pool is served under ``/pool/<course>-<n>/`` (Streamlit's
+``--server.baseUrlPath``), and the generated nginx config redirects the
+interaction's URLs there, both ``/?course=<course>&interaction=<n>`` and the
+old ``/<course>/<n>/``, and sends everything else to the default pool.
+Within a pool nginx sends each connection to the worker with the fewest open
+connections; conversations are kept in the shared session state
+(``engagebot.state``), so a browser that reconnects to another worker (or a
+classroom behind one NAT address) is served just the same. nginx also gives
+each browser a random conversation id in the ``sigma_session`` cookie.
+
+The supervisor restarts workers that exit (backing off if they keep
+crashing), and on SIGHUP re-reads the config: workers the new config adds
+are started on free ports and must answer their health check before the
+nginx config is rewritten to route to them, workers it no longer needs are
+stopped only after that, and the rest are restarted one at a time, each once
+the previous one is healthy, so a pool with more than one worker keeps
+serving throughout.
+SIGTERM or Ctrl-C stops all workers.
+"""
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import tomllib
+import urllib.request
+
+from dotenv import load_dotenv
+
+from engagebot.interactions import get_registry
+from engagebot.state import SESSION_COOKIE
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, 'sigma_app.py')
+
+# Seconds a restarted worker gets to answer its health check.
+START_TIMEOUT = 60
+# Workers that stay up this long have their restart backoff reset.
+STABLE_SECONDS = 60
+MAX_BACKOFF = 30.0
+
+
+class Pool:
+    """Workers serving one URL prefix; ``course``/``interaction`` are None for the default pool."""
+
+    def __init__(self, workers: int, course=None, interaction=None):
+        self.workers = workers
+        self.course = course
+        self.interaction = interaction
+
+    @property
+    def name(self) -> str:
+        return f'{self.course}-{self.interaction}' if self.course else 'default'
+
+    @property
+    def prefix(self) -> str:
+        return f'/pool/{self.name}' if self.course else ''
+
+
+def load_config(path: str) -> tuple:
+    """(base_port, pools) from ``path``; one default pool of two workers if it does not exist."""
+    data = {}
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            data = tomllib.load(f)
+    pools = [Pool(int(data.get('workers', 2)))]
+    for pool in data.get('pools', []):
+        pools.append(Pool(int(pool.get('workers', 1)), str(pool['course']), str(pool['interaction'])))
+    return int(data.get('base_port', 8501)), pools
+
+
+def assign_ports(base_port: int, pools, running=()) -> list:
+    """(pool, port) for every worker, numbered from ``base_port``.
+
+    ``running`` lists the (pool name, port) of the workers already up: a pool
+    keeps the ports of its running workers, and new workers get the lowest
+    ports that no running worker holds, so they can start alongside them.
+    """
+    held = {}
+    for name, port in running:
+        if port >= base_port:
+            held.setdefault(name, []).append(port)
+    taken = {port for _, port in running}
+    slots = []
+    for pool in pools:
+        ports = sorted(held.get(pool.name, []))[:pool.workers]
+        while len(ports) < pool.workers:
+            port = base_port
+            while port in taken:
+                port += 1
+            taken.add(port)
+            ports.append(port)
+        slots.extend((pool, port) for port in ports)
+    return slots
+
+
+_PROXY = """\
+    proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+    proxy_set_header Host $http_host;
+    proxy_redirect off;
+    proxy_http_version 1.1;
+    proxy_set_header Upgrade $http_upgrade;
+    proxy_set_header Connection "upgrade";
+    proxy_read_timeout 1h;
+"""
+
+
+def render_nginx(slots, listen=80) -> str:
+    lines = ['# Generated by python -m engagebot.supervisor; edit supervisor.toml instead.', '']
+    pools = {}
+    for pool, port in slots:
+        pools.setdefault(pool.name, (pool, []))[1].append(port)
+    for name, (pool, ports) in pools.items():
+        lines.append(f'upstream sigma-{name} {{')
+        lines.append('  least_conn;')
+        lines.extend(f'  server 127.0.0.1:{port};' for port in ports)
+        lines.append('}')
+    dedicated = [pool for pool, _ in pools.values() if pool.course]
+    if dedicated:
+        # Pool prefix of the interaction named in the query string, if it has a pool of its own.
+        lines += ['', 'map "$arg_course/$arg_interaction" $sigma_pool {', '  default "";']
+        lines.extend(f'  "{pool.course}/{pool.interaction}" {pool.prefix};' for pool in dedicated)
+        lines.append('}')
+    # A browser without a conversation cookie gets one; $request_id is 32 random hex digits.
+    max_age = int(float(os.environ.get('SESSION_STATE_TTL', '604800')))
+    lines += ['', f'map $cookie_{SESSION_COOKIE} $sigma_set_cookie {{',
+              f'  "" "{SESSION_COOKIE}=$request_id; Path=/; Max-Age={max_age}; HttpOnly; SameSite=Lax";',
+              '  default "";', '}']
+    lines += ['', 'server {', f'  listen {listen};', '  server_name localhost;',
+              '  add_header Set-Cookie $sigma_set_cookie;', '']
+
+    for name, (pool, _) in pools.items():
+        if pool.course:
+            lines.append(f'  location ~ ^/{pool.course}/{pool.interaction}/?$ {{')
+            lines.append(f'    return 302 {pool.prefix}/?course={pool.course}&interaction={pool.interaction}&$args;')
+            lines.append('  }')
+            lines.append(f'  location ^~ {pool.prefix}/ {{')
+            lines.append(_PROXY + f'    proxy_pass http://sigma-{name};')
+            lines.append('  }')
+    lines.append('  # Other per-interaction URLs open the interaction in the default pool.')
+    lines.append('  location ~ ^/([a-z][a-z0-9_]*)/([0-9]+)/?$ {')
+    lines.append('    return 302 /?course=$1&interaction=$2&$args;')
+    lines.append('  }')
+    lines.append('  location / {')
+    if dedicated:
+        lines.append('    if ($sigma_pool) {')
+        lines.append('      return 302 $sigma_pool/$is_args$args;')
+        lines.append('    }')
+    lines.append(_PROXY + '    proxy_pass http://sigma-default;')
+    lines.append('  }')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+class Worker:
+    """One ``streamlit run sigma_app.py`` process on a fixed port."""
+
+    def __init__(self, pool: Pool, port: int, index: int):
+        self.pool = pool
+        self.port = port
+        self.index = index
+        self.process = None
+        self.started_at = 0.0
+        self.backoff = 0.0
+        self.restart_at = 0.0
+        self.restarts = 0
+
+    def start(self):
+        env = dict(os.environ)
+        # Give each worker its own metrics endpoint.
+        if env.get('METRICS_PORT', '0') != '0':
+            env['METRICS_PORT'] = str(int(env['METRICS_PORT']) + self.index)
+        command = [
+            sys.executable, '-m', 'streamlit', 'run', APP,
+            '--server.port', str(self.port), '--server.headless', 'true',
+        ]
+        if self.pool.prefix:
+            command += ['--server.baseUrlPath', self.pool.prefix]
+        self.process = subprocess.Popen(command, cwd=ROOT, env=env)
+        self.started_at = time.monotonic()
+        logger.info("started worker %s:%d (pid %d)", self.pool.name, self.port, self.process.pid)
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def healthy(self) -> bool:
+        url = f'http://127.0.0.1:{self.port}{self.pool.prefix}/_stcore/health'
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                return response.status == 200
+        except OSError:
+            return False
+
+    def wait_healthy(self, timeout=START_TIMEOUT) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.alive():
+                return False
+            if self.healthy():
+                return True
+            time.sleep(0.5)
+        return False
+
+    def stop(self, timeout=10):
+        if not self.alive():
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class Supervisor:
+    def __init__(self, config_path: str, nginx_conf=None, nginx_reload=None):
+        self.config_path = config_path
+        self.nginx_conf = nginx_conf
+        self.nginx_reload = nginx_reload
+        self.workers = []
+        self._stopping = False
+        self._reload_requested = False
+
+    def plan(self) -> tuple:
+        """(base_port, slots) for the current config, keeping the ports of running workers."""
+        base_port, pools = load_config(self.config_path)
+        known = get_registry().all()
+        for pool in pools[1:]:
+            if (pool.course, pool.interaction) not in known:
+                logger.warning("pool %s names an interaction that is not defined", pool.name)
+        return base_port, assign_ports(base_port, pools, [(w.pool.name, w.port) for w in self.workers])
+
+    def write_nginx(self, text: str):
+        if not self.nginx_conf:
+            return
+        try:
+            with open(self.nginx_conf) as f:
+                if f.read() == text:
+                    return
+        except FileNotFoundError:
+            pass
+        with open(self.nginx_conf + '.tmp', 'w') as f:
+            f.write(text)
+        os.replace(self.nginx_conf + '.tmp', self.nginx_conf)
+        logger.info("wrote %s", self.nginx_conf)
+        if self.nginx_reload:
+            subprocess.run(self.nginx_reload, shell=True, check=False)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGHUP, self._request_reload)
+
+        base_port, slots = self.plan()
+        self.write_nginx(render_nginx(slots))
+        self.workers = [Worker(pool, port, port - base_port) for pool, port in slots]
+        for worker in self.workers:
+            worker.start()
+        try:
+            while not self._stopping:
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self.rolling_restart()
+                self.check_workers()
+                time.sleep(1)
+        finally:
+            for worker in self.workers:
+                worker.stop()
+
+    def check_workers(self):
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.alive():
+                if worker.backoff and now - worker.started_at > STABLE_SECONDS:
+                    worker.backoff = 0.0
+                continue
+            if worker.restart_at == 0.0:
+                code = worker.process.returncode if worker.process else None
+                worker.backoff = min(max(worker.backoff * 2, 1.0), MAX_BACKOFF)
+                worker.restart_at = now + worker.backoff
+                logger.warning("worker %s:%d exited (%s); restarting in %.0fs",
+                               worker.pool.name, worker.port, code, worker.backoff)
+            elif now >= worker.restart_at:
+                worker.restart_at = 0.0
+                worker.restarts += 1
+                worker.start()
+
+    def rolling_restart(self):
+        """Apply the current config without sending requests to workers that are not up.
+
+        Workers on new ports start first, and nginx is pointed at them only
+        once they all answer their health check; the workers it no longer
+        routes to are stopped after the reload. The workers that keep their
+        ports are then restarted in place, one at a time.
+        """
+        base_port, slots = self.plan()
+        old = {worker.port: worker for worker in self.workers}
+        started = []
+        for pool, port in slots:
+            if port in old:
+                continue
+            worker = Worker(pool, port, port - base_port)
+            worker.start()
+            started.append(worker)
+        for worker in started:
+            if self._stopping or not worker.wait_healthy():
+                if not self._stopping:
+                    logger.warning("worker %s:%d is not healthy; keeping the previous config",
+                                   worker.pool.name, worker.port)
+                for new in started:
+                    new.stop()
+                return
+
+        self.write_nginx(render_nginx(slots))
+        kept = {port for _, port in slots}
+        for port, worker in old.items():
+            if port not in kept:
+                worker.stop()
+        current = {worker.port: worker for worker in started}
+        current.update((port, worker) for port, worker in old.items() if port in kept)
+        self.workers = [current[port] for _, port in slots]
+
+        for i, (pool, port) in enumerate(slots):
+            if port not in old or self._stopping:
+                continue
+            old[port].stop()
+            worker = Worker(pool, port, port - base_port)
+            worker.start()
+            self.workers[i] = worker
+            if not worker.wait_healthy():
+                logger.warning("worker %s:%d is not healthy; continuing", pool.name, port)
+        logger.info("rolling restart finished (%d workers)", len(self.workers))
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def _request_reload(self, signum, frame):
+        self._reload_requested = True
+
+
+def main(argv=None) -> int:
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s supervisor: %(message)s')
+    parser = argparse.ArgumentParser(description="Run the Sigma Streamlit workers and generate their nginx config.")
+    parser.add_argument('--config', default=os.path.join(ROOT, 'supervisor.toml'))
+    parser.add_argument('--nginx-conf', help="write the nginx config here")
+    parser.add_argument('--nginx-reload', default='sudo systemctl reload nginx.service',
+                        help="command run after the nginx config changed")
+    parser.add_argument('--print-nginx', action='store_true', help="print the nginx config and exit")
+    args = parser.parse_args(argv)
+
+    if args.print_nginx:
+        base_port, pools = load_config(args.config)
+        print(render_nginx(assign_ports(base_port, pools)), end='')
+        return 0
+
+    Supervisor(args.config, args.nginx_conf, args.nginx_reload).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
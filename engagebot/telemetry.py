@@ -0,0 +1,174 @@
+"""Per-turn inference telemetry and a Prometheus metrics endpoint.
+
+The final chunk of an Ollama stream carries ``eval_count``,
+``eval_duration``, ``prompt_eval_count``, ``prompt_eval_duration`` and
+``load_duration``. The gateway passes it to ``TurnTelemetry.record``, which
+keeps a per-turn record tagged with course, week, interaction and session id,
+and adds the numbers to counters exposed in the Prometheus text format.
+
+Session ids are kept on the per-turn records (and in the log) but are not
+used as metric labels, since one series per student would swamp Prometheus.
+
+Set ``METRICS_PORT`` to serve ``GET /metrics`` from the process.
+"""
+import json
+import logging
+import os
+import threading
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from engagebot.context import message_tokens
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the time-to-first-token histogram buckets.
+TTFT_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+# Per-turn records kept in memory for inspection.
+RECENT_TURNS = 1000
+
+_LABELS = ('course', 'week', 'interaction', 'model')
+
+# Ollama reports durations in nanoseconds.
+_NS = 1e9
+
+
+class TurnTelemetry:
+    """Collects per-turn records and aggregates them per course/week/interaction/model."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.recent = deque(maxlen=RECENT_TURNS)
+        self.counters = defaultdict(lambda: defaultdict(float))
+        self.ttft = defaultdict(lambda: [0] * (len(TTFT_BUCKETS) + 1))
+        self.ttft_sum = defaultdict(float)
+
+    def record(self, request, chunk):
+        ttft = None
+        if request.first_token_at is not None and request.started_at is not None:
+            ttft = request.first_token_at - request.started_at
+        turn = {
+            'course': request.tags.get('course'),
+            'week': request.tags.get('week'),
+            'interaction': request.tags.get('interaction'),
+            'session_id': request.session_id,
+            'model': request.model,
+            'host': request.backend.host if request.backend is not None else None,
+            'queue_wait': request.started_at - request.enqueued_at if request.started_at else None,
+            'ttft': ttft,
+            'eval_count': chunk.get('eval_count') or 0,
+            'eval_duration': (chunk.get('eval_duration') or 0) / _NS,
+            # Estimated size of the prompt sent; prompt_eval_count below it was served from Ollama's prefix cache.
+            'prompt_tokens': sum(message_tokens(message) for message in request.messages),
+            'prompt_eval_count': chunk.get('prompt_eval_count') or 0,
+            'prompt_eval_duration': (chunk.get('prompt_eval_duration') or 0) / _NS,
+            'load_duration': (chunk.get('load_duration') or 0) / _NS,
+            'total_duration': (chunk.get('total_duration') or 0) / _NS,
+        }
+        labels = tuple(str(turn[name]) for name in _LABELS)
+
+        with self._lock:
+            self.recent.append(turn)
+            counters = self.counters[labels]
+            counters['turns'] += 1
+            counters['eval_tokens'] += turn['eval_count']
+            counters['eval_seconds'] += turn['eval_duration']
+            counters['prompt_tokens'] += turn['prompt_tokens']
+            counters['prompt_eval_tokens'] += turn['prompt_eval_count']
+            counters['prompt_eval_seconds'] += turn['prompt_eval_duration']
+            counters['load_seconds'] += turn['load_duration']
+            if ttft is not None:
+                buckets = self.ttft[labels]
+                index = next((i for i, bound in enumerate(TTFT_BUCKETS) if ttft <= bound), len(TTFT_BUCKETS))
+                buckets[index] += 1
+                self.ttft_sum[labels] += ttft
+
+        logger.info("turn %s", json.dumps(turn))
+
+    def render(self) -> str:
+        """Counters and TTFT histogram in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = {labels: dict(values) for labels, values in self.counters.items()}
+            ttft = {labels: list(buckets) for labels, buckets in self.ttft.items()}
+            ttft_sum = dict(self.ttft_sum)
+
+        for name, help_text in (
+            ('turns', 'Completed chat turns.'),
+            ('eval_tokens', 'Tokens generated.'),
+            ('eval_seconds', 'Time spent generating tokens.'),
+            ('prompt_tokens', 'Prompt tokens sent (estimated), including any cached prefix.'),
+            ('prompt_eval_tokens', 'Prompt tokens evaluated (prefill), excluding cached prefix.'),
+            ('prompt_eval_seconds', 'Time spent evaluating prompts (prefill).'),
+            ('load_seconds', 'Time spent loading the model.'),
+        ):
+            metric = f'engagebot_{name}_total'
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} counter')
+            for labels, values in counters.items():
+                lines.append(f'{metric}{{{_format_labels(labels)}}} {values.get(name, 0):g}')
+
+        metric = 'engagebot_ttft_seconds'
+        lines.append(f'# HELP {metric} Time from the request reaching Ollama to the first token.')
+        lines.append(f'# TYPE {metric} histogram')
+        for labels, buckets in ttft.items():
+            label_text = _format_labels(labels)
+            cumulative = 0
+            for bound, count in zip(TTFT_BUCKETS + ('+Inf',), buckets):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{{label_text}}} {ttft_sum.get(labels, 0):g}')
+            lines.append(f'{metric}_count{{{label_text}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels) -> str:
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(_LABELS, labels))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+telemetry = TurnTelemetry()
+
+# Extra exposition sources (e.g. gateway queue gauges), each returning text.
+metric_sources = [telemetry.render]
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None):
+    """Serve GET /metrics on ``port`` (default ``METRICS_PORT``) once per process."""
+    global _server
+    if port is None:
+        port = int(os.getenv('METRICS_PORT', '0'))
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') != '/metrics':
+                self.send_error(404)
+                return
+            body = ''.join(source() for source in metric_sources).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((os.getenv('METRICS_BIND', '127.0.0.1'), port), Handler)
+            except OSError as e:
+                logger.warning("metrics endpoint not started on port %d: %s", port, e)
+                return None
+            threading.Thread(target=_server.serve_forever, name='engagebot-metrics', daemon=True).start()
+        return _server
@@ -0,0 +1,142 @@
+"""Preload models at startup and report readiness.
+
+The first student after a restart otherwise waits for the model to be loaded
+into GPU memory. Run this before starting the Streamlit workers:
+
+    python -m engagebot.warmup --model mixtral
+
+By default every host in ``OLLAMA_HOSTS`` is warmed. It sends an empty
+generate request (which makes Ollama load the model without
+producing tokens) with the keep-alive chat requests also use
+(``OLLAMA_KEEP_ALIVE``, by default until Ollama restarts), retrying until Ollama answers or
+``--timeout`` runs out. The exit status is 0 once every model is loaded.
+
+Readiness can be polled afterwards by a supervisor:
+
+    python -m engagebot.warmup --check ...          # exit status only
+    python -m engagebot.warmup --serve 8590 ...     # GET /ready -> 200 or 503
+"""
+import argparse
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+from engagebot.client import get_client
+from engagebot.prefix import keep_alive as default_keep_alive
+from engagebot.router import configured_hosts
+
+# Seconds a readiness answer is reused before Ollama is asked again.
+READY_CACHE_SECONDS = 5
+
+
+def preload(host: str, model: str, keep_alive) -> None:
+    """Load ``model`` on ``host`` without generating any tokens."""
+    get_client(host).generate(model=model, prompt='', keep_alive=keep_alive)
+
+
+def loaded_models(host: str) -> set:
+    """Names of the models currently resident on ``host``."""
+    names = set()
+    for model in get_client(host).ps()['models']:
+        names.add(model['name'])
+        names.add(model['name'].split(':')[0])
+    return names
+
+
+def is_ready(hosts, models) -> bool:
+    for host in hosts:
+        try:
+            resident = loaded_models(host)
+        except Exception:
+            return False
+        if not all(model in resident for model in models):
+            return False
+    return True
+
+
+def warm_up(host: str, models, keep_alive, timeout: float) -> bool:
+    """Preload every model, retrying until they are loaded or ``timeout`` passes."""
+    deadline = time.monotonic() + timeout
+    pending = list(models)
+    while pending:
+        model = pending[0]
+        try:
+            started = time.monotonic()
+            preload(host, model, keep_alive)
+            print(f"warmup: {model} loaded on {host} in {time.monotonic() - started:.1f}s")
+            pending.pop(0)
+        except Exception as e:
+            if time.monotonic() >= deadline:
+                print(f"warmup: giving up on {model} at {host}: {e}", file=sys.stderr)
+                return False
+            print(f"warmup: {host} not ready ({e}), retrying", file=sys.stderr)
+            time.sleep(2)
+    return True
+
+
+def serve_readiness(port: int, hosts, models) -> None:
+    """Answer GET /ready with 200 when the models are loaded and 503 otherwise."""
+    lock = threading.Lock()
+    cached = {'ready': False, 'checked': 0.0}
+
+    def ready() -> bool:
+        with lock:
+            if time.monotonic() - cached['checked'] > READY_CACHE_SECONDS:
+                cached['ready'] = is_ready(hosts, models)
+                cached['checked'] = time.monotonic()
+            return cached['ready']
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') != '/ready':
+                self.send_error(404)
+                return
+            ok = ready()
+            body = b'ready\n' if ok else b'not ready\n'
+            self.send_response(200 if ok else 503)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    ThreadingHTTPServer(('127.0.0.1', port), Handler).serve_forever()
+
+
+def main(argv=None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Preload Ollama models and report readiness.")
+    parser.add_argument('--host', action='append', dest='hosts', help="ollama host (repeatable, default OLLAMA_HOSTS)")
+    parser.add_argument('--model', action='append', dest='models', help="model to preload (repeatable)")
+    parser.add_argument('--keep-alive',
+                        help="how long the model stays loaded (default OLLAMA_KEEP_ALIVE, -1: until Ollama restarts); "
+                             "chat requests reset it to OLLAMA_KEEP_ALIVE")
+    parser.add_argument('--timeout', type=float, default=600, help="seconds to keep retrying")
+    parser.add_argument('--check', action='store_true', help="only report whether the models are loaded")
+    parser.add_argument('--serve', type=int, metavar='PORT', help="serve GET /ready on PORT after warming up")
+    args = parser.parse_args(argv)
+
+    hosts = args.hosts or configured_hosts()
+    models = args.models or ['llama3.1']
+    keep_alive = default_keep_alive()
+    if args.keep_alive is not None:
+        # Ollama accepts durations like "30m" as well as a number of seconds.
+        keep_alive = int(args.keep_alive) if args.keep_alive.lstrip('-').isdigit() else args.keep_alive
+
+    if args.check:
+        return 0 if is_ready(hosts, models) else 1
+
+    ok = all([warm_up(host, models, keep_alive, args.timeout) for host in hosts])
+    if args.serve:
+        # Keep serving even if warm-up failed; /ready answers 503 until the models load.
+        serve_readiness(args.serve, hosts, models)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,11 @@
 #!/bin/bash
 
-# Stop streamlit process when quitting with Ctrl-c.
+# Stop the supervisor (and its streamlit workers) when quitting with Ctrl-c.
 trap 'ctrl_c' EXIT
 function ctrl_c() {
-  if pgrep -x streamlit > /dev/null; then
+  if pgrep -f engagebot.supervisor > /dev/null; then
     echo "Stopping streamlit..."
-    kill `pgrep -f streamlit`
+    kill `pgrep -f engagebot.supervisor`
   fi
 }
 
@@ -29,7 +29,7 @@ if ! grep -q sigma ~/.bash_profile; then
 fi
 
 # Ensure we're not running multiple copies of this script.
-if pgrep -x "streamlit" > /dev/null; then
+if pgrep -f engagebot.supervisor > /dev/null; then
   echo "streamlit is already running. Attach to the tmux session with:"
   echo "   tmux a -t sigma"
   echo "Exiting."
@@ -49,79 +49,19 @@ if ! command -v git &> /dev/null; then
   sudo yum install -y git
 fi
 
-# Ensure nginx is installed and configured.
-if [ ! -f /etc/nginx/conf.d/websocket-streamlit.conf ]; then
+# Ensure nginx is installed. Its proxy config is generated by the supervisor below.
+if ! command -v nginx &> /dev/null; then
   # Install nginx from amazon-linux-extras.
   sudo amazon-linux-extras install -y nginx1
-  # Configure reverse proxy for streamlit port 8051.
-  cat <<EOF | sudo tee /etc/nginx/conf.d/websocket-streamlit.conf
-upstream streamlit            { server localhost:8501; }
-
-upstream streamlit-nsc396a-1  { server localhost:8601; }
-upstream streamlit-nsc396a-2  { server localhost:8602; }
-upstream streamlit-nsc396a-3  { server localhost:8603; }
-upstream streamlit-nsc396a-4  { server localhost:8604; }
-upstream streamlit-nsc396a-5  { server localhost:8605; }
-upstream streamlit-nsc396a-6  { server localhost:8606; }
-upstream streamlit-nsc396a-7  { server localhost:8607; }
-upstream streamlit-nsc396a-8  { server localhost:8608; }
-upstream streamlit-nsc396a-9  { server localhost:8609; }
-upstream streamlit-nsc396a-10 { server localhost:8610; }
-
-upstream streamlit-gist330-1  { server localhost:8701; }
-upstream streamlit-gist330-2  { server localhost:8702; }
-upstream streamlit-gist330-3  { server localhost:8703; }
-upstream streamlit-gist330-4  { server localhost:8704; }
-upstream streamlit-gist330-5  { server localhost:8705; }
-upstream streamlit-gist330-6  { server localhost:8706; }
-upstream streamlit-gist330-7  { server localhost:8707; }
-upstream streamlit-gist330-8  { server localhost:8708; }
-upstream streamlit-gist330-9  { server localhost:8709; }
-upstream streamlit-gist330-10 { server localhost:8710; }
-
-server {
-  listen 80;
-  server_name localhost;
-
-  # Proxy requests to a backend mapped to a specific port per streamlit process.
-  location / {
-    proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-    proxy_set_header Host $http_host;
-    proxy_redirect off;
-    proxy_http_version 1.1;
-    proxy_set_header Upgrade $http_upgrade;
-    proxy_set_header Connection "upgrade";
-
-    # Default streamlit port.
-    proxy_pass http://streamlit;
-
-    # Custom ports for different streamlit processes serving each course/week.
-    location ^~ /nsc396a/1/  { proxy_pass http://streamlit-nsc396a-1/; }
-    location ^~ /nsc396a/2/  { proxy_pass http://streamlit-nsc396a-2/; }
-    location ^~ /nsc396a/3/  { proxy_pass http://streamlit-nsc396a-3/; }
-    location ^~ /nsc396a/4/  { proxy_pass http://streamlit-nsc396a-4/; }
-    location ^~ /nsc396a/5/  { proxy_pass http://streamlit-nsc396a-5/; }
-    location ^~ /nsc396a/6/  { proxy_pass http://streamlit-nsc396a-6/; }
-    location ^~ /nsc396a/7/  { proxy_pass http://streamlit-nsc396a-7/; }
-    location ^~ /nsc396a/8/  { proxy_pass http://streamlit-nsc396a-8/; }
-    location ^~ /nsc396a/9/  { proxy_pass http://streamlit-nsc396a-9/; }
-    location ^~ /nsc396a/10/ { proxy_pass http://streamlit-nsc396a-10/; }
-    location ^~ /gist330/1/  { proxy_pass http://streamlit-gist330-1/; }
-    location ^~ /gist330/2/  { proxy_pass http://streamlit-gist330-2/; }
-    location ^~ /gist330/3/  { proxy_pass http://streamlit-gist330-3/; }
-    location ^~ /gist330/4/  { proxy_pass http://streamlit-gist330-4/; }
-    location ^~ /gist330/5/  { proxy_pass http://streamlit-gist330-5/; }
-    location ^~ /gist330/6/  { proxy_pass http://streamlit-gist330-6/; }
-    location ^~ /gist330/7/  { proxy_pass http://streamlit-gist330-7/; }
-    location ^~ /gist330/8/  { proxy_pass http://streamlit-gist330-8/; }
-    location ^~ /gist330/9/  { proxy_pass http://streamlit-gist330-9/; }
-    location ^~ /gist330/10/ { proxy_pass http://streamlit-gist330-10/; }
-  }
-}
-EOF
   # Run nginx on boot.
   sudo systemctl enable nginx.service
 fi
+# Let the supervisor, running as this user, rewrite the proxy config.
+NGINX_CONF=/etc/nginx/conf.d/websocket-streamlit.conf
+if [ ! -O $NGINX_CONF ]; then
+  sudo touch $NGINX_CONF
+  sudo chown $USER $NGINX_CONF
+fi
 # Ensure nginx is started.
 sudo systemctl start nginx.service
 
@@ -200,6 +140,11 @@ if [ ! -v PG_PASS ] && ! $(grep -q PG_PASS ~/EngageBot/.env); then
   read -r -s PG_PASS
   export PG_PASS="${PG_PASS}"
 fi
+if [ ! -v OLLAMA_HOSTS ] && ! $(grep -q OLLAMA_HOSTS ~/EngageBot/.env); then
+  echo -e "OLLAMA_HOSTS not found in ~/EngageBot/.env. Add it now (comma separated): "
+  read -r OLLAMA_HOSTS
+  export OLLAMA_HOSTS="${OLLAMA_HOSTS}"
+fi
 if [ ! -v PG_DB ] && ! $(grep -q PG_DB ~/EngageBot/.env); then
   echo -e "PG_DB not found in ~/EngageBot/.env. Add it now: "
   read -r -s PG_DB
@@ -227,23 +172,15 @@ echo "####################################################"
 # Run app(s).
 cd ~/EngageBot
 
-#streamlit run nsc396a/nsc396a_interaction1.py --server.port 8601 &
-streamlit run nsc396a/nsc396a_interaction2.py --server.port 8602 &
-streamlit run nsc396a/nsc396a_interaction3.py --server.port 8603 &
-streamlit run nsc396a/nsc396a_interaction4.py --server.port 8604 &
-#streamlit run nsc396a/nsc396a_interaction5.py --server.port 8605 &
-#streamlit run nsc396a/nsc396a_interaction6.py --server.port 8606 &
-#streamlit run nsc396a/nsc396a_interaction7.py --server.port 8607 &
-#streamlit run nsc396a/nsc396a_interaction8.py --server.port 8608 &
-#streamlit run nsc396a/nsc396a_interaction9.py --server.port 8609 &
-#streamlit run nsc396a/nsc396a_interaction10.py --server.port 8610 &
-#streamlit run gist330/gist330_interaction1.py --server.port 8701 &
-streamlit run gist330/gist330_interaction2.py --server.port 8702 &
-streamlit run gist330/gist330_interaction3.py --server.port 8703 &
-streamlit run gist330/gist330_interaction4.py --server.port 8704 &
-#streamlit run gist330/gist330_interaction5.py --server.port 8705 &
-#streamlit run gist330/gist330_interaction6.py --server.port 8706 &
-#streamlit run gist330/gist330_interaction7.py --server.port 8707 &
-#streamlit run gist330/gist330_interaction8.py --server.port 8708 &
-#streamlit run gist330/gist330_interaction9.py --server.port 8709 &
-#streamlit run gist330/gist330_interaction10.py --server.port 8710 &
+# Preload the model before opening the Streamlit ports, so the first student
+# does not wait for it to load. Readiness is then served on localhost:8590/ready.
+OLLAMA_WARMUP_ARGS="--model mixtral"
+if ! python -m engagebot.warmup $OLLAMA_WARMUP_ARGS; then
+  echo "Model warm-up failed; starting streamlit anyway."
+fi
+python -m engagebot.warmup $OLLAMA_WARMUP_ARGS --timeout 0 --serve 8590 &
+
+# Streamlit workers for the interactions in interactions/, as configured in
+# supervisor.toml. Crashed workers are restarted; after editing supervisor.toml,
+# apply it with a rolling restart: kill -HUP `pgrep -f engagebot.supervisor`
+python -m engagebot.supervisor --nginx-conf $NGINX_CONF
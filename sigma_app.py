@@ -0,0 +1,26 @@
+"""One Streamlit app serving every interaction.
+
+    streamlit run sigma_app.py --server.port 8501
+
+The interaction is chosen by query parameters, e.g. ``/?course=nsc396a&interaction=2``
+for what ``nsc396a/nsc396a_interaction2.py`` used to serve on its own port
+(nginx redirects the old ``/nsc396a/2/`` URLs here). Streamlit, the shared
+gateway, history writer and pools are loaded once for all of them; the
+history layer and the Ollama client only when first needed.
+"""
+import streamlit as st
+
+from engagebot.interactions import DEFAULT_TITLE, get_interaction
+from engagebot.page import render_interaction, render_page_header
+
+# Load environment variables from .env if it exists.
+from dotenv import load_dotenv
+load_dotenv()
+
+definition = get_interaction(st.query_params.get('course', ''), st.query_params.get('interaction', ''))
+if definition is None:
+    render_page_header(DEFAULT_TITLE)
+    st.title(DEFAULT_TITLE)
+    st.error("This chat could not be found. Please open it from the link on your course page.")
+else:
+    render_interaction(definition)
@@ -0,0 +1,36 @@
+"""Cold-start regression test for the Sigma worker imports (see bench/bench_imports.py).
+
+The budget is ``IMPORT_BUDGET_MS`` milliseconds (default 1500), compared with
+the median of a few cold starts; set it for the machine that runs the tests.
+"""
+import os
+import statistics
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+
+from bench_imports import DEFAULT_FORBID, DEFAULT_MODULES, loaded_packages, measure, summarise
+
+# The app's own dependencies must be installed for the imports to be measured.
+pytest.importorskip('streamlit')
+pytest.importorskip('httpx')
+
+BUDGET_MS = float(os.getenv('IMPORT_BUDGET_MS', '1500'))
+RUNS = 3
+
+
+@pytest.fixture(scope='module')
+def runs():
+    # The first run warms the bytecode cache, so it is not counted.
+    return [measure(DEFAULT_MODULES) for _ in range(RUNS + 1)][1:]
+
+
+def test_cold_start_within_budget(runs):
+    median = statistics.median(summarise(entries, top=0)['total_ms'] for entries in runs)
+    assert median <= BUDGET_MS, f"importing {', '.join(DEFAULT_MODULES)} took {median:.0f} ms"
+
+
+def test_deferred_packages_not_loaded(runs):
+    assert not loaded_packages(runs[0]).intersection(DEFAULT_FORBID)
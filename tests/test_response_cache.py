@@ -0,0 +1,30 @@
+"""Responses that ``engagebot.cache.caching_stream`` stores under a cache key."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engagebot.cache import ResponseCache, caching_stream
+
+MESSAGES = [{'role': 'system', 'content': 'prompt'}, {'role': 'user', 'content': 'hi'}]
+
+
+def stream(model):
+    yield {'model': model, 'message': {'content': 'Hello '}, 'done': False}
+    yield {'model': model, 'message': {'content': 'there'}, 'done': True}
+
+
+def test_completed_response_is_cached():
+    cache = ResponseCache(ttl=60, max_entries=8)
+    key = cache.key(('nsc396a', '1', '1'), 'llama3.1', MESSAGES)
+    list(caching_stream(stream('llama3.1'), cache, key))
+    assert cache.get(key) == 'Hello there'
+
+
+def test_fallback_response_is_not_cached():
+    cache = ResponseCache(ttl=60, max_entries=8)
+    key = cache.key(('nsc396a', '1', '1'), 'llama3.1', MESSAGES)
+    # The gateway switched to the fallback model after a missed TTFT deadline.
+    chunks = list(caching_stream(stream('small'), cache, key))
+    assert ''.join(chunk['message']['content'] for chunk in chunks) == 'Hello there'
+    assert cache.get(key) is None